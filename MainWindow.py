@@ -1,11 +1,11 @@
-from PyQt6.QtWidgets import QMainWindow, QWidget, QHBoxLayout, QVBoxLayout
+from PyQt6.QtWidgets import QMainWindow, QWidget, QHBoxLayout, QVBoxLayout, QMessageBox
 from PyQt6.QtGui import QIcon
 from PyQt6.QtCore import Qt, pyqtSlot
 
-from structures import ImageFile
+from structures import ImageFile, Session
 from Preview import ImagePreview
-from Menus import CropMenu, LoadMenu, SortMenu, LayoutMenu
-from Saving import SaveWidget
+from Thumbnails import ThumbnailView
+from Menus import CropMenu, LoadMenu, SortMenu, LayoutMenu, SaveWidget
 
 
 class MainWindow(QMainWindow):
@@ -26,6 +26,7 @@ class MainWindow(QMainWindow):
 
         # widgets
         self.preview = ImagePreview(self.files)
+        self.thumbnails = ThumbnailView(self.files)
         self.load_menu = LoadMenu()
         self.save_widget = SaveWidget(self.files)
         self.layout_menu = LayoutMenu()
@@ -36,22 +37,30 @@ class MainWindow(QMainWindow):
         self.preview.previewChanged.connect(self.set_current_image)
         self.preview.previewChanged.connect(self.crop_menu.load_margins)
         self.preview.previewChanged.connect(self.save_widget.hide_progress)
+        self.preview.previewChanged.connect(self.thumbnails.select_index)
+        self.preview.previewChanged.connect(self.save_widget.set_current_file)
+        self.thumbnails.indexSelected.connect(self.preview.go_to_index)
 
         self.load_menu.loadedFiles.connect(self.load_files)
         self.load_menu.loadedFiles.connect(lambda: self.sort_menu.sort_files())
         self.load_menu.loadedFiles.connect(lambda: self.crop_menu.set_limits(self.max_image_width,
                                                                              self.max_image_height))
         self.load_menu.loadedFiles.connect(lambda: self.preview.go_to_index())
+        self.load_menu.loadedFiles.connect(self.save_widget.files_changed)
+        self.load_menu.sessionOpened.connect(self.load_session)
+        self.load_menu.sessionSaved.connect(self.save_session)
 
+        self.sort_menu.selectionChanged.connect(self.thumbnails.reset_files)
         self.sort_menu.selectionChanged.connect(lambda: self.preview.go_to_index())
-        self.save_widget.startedSaving.connect(lambda: self.toggle_menu_enabled(False))
-        self.save_widget.finishedSaving.connect(lambda: self.toggle_menu_enabled(True))
+        self.sort_menu.selectionChanged.connect(self.save_widget.files_changed)
 
         self.crop_menu.marginsChanged.connect(self.set_crop_margins)
         self.crop_menu.marginsChanged.connect(self.preview.update_preview)
+        self.crop_menu.marginsChanged.connect(self.save_widget.files_changed)
 
         self.layout_menu.selectionChanged.connect(self.save_widget.set_pdf_layout)
         self.layout_menu.coverChecked.connect(self.save_widget.set_separate_cover)
+        self.layout_menu.gapsChecked.connect(self.save_widget.set_cut_at_gaps)
 
         self.__setup_layout()
 
@@ -68,27 +77,14 @@ class MainWindow(QMainWindow):
         option_layout.addWidget(self.layout_menu)
         option_layout.addWidget(self.save_widget)
 
+        main_layout.addWidget(self.thumbnails)
         main_layout.addWidget(self.preview)
         main_layout.addStretch()
         main_layout.addLayout(option_layout)
-        main_layout.setStretch(0, 1)
-        main_layout.setStretch(1, 0)
+        main_layout.setStretch(1, 1)
+        main_layout.setStretch(2, 0)
         self.setCentralWidget(center_widget)
 
-    @pyqtSlot(bool)
-    def toggle_menu_enabled(self, enabled):
-        """
-        sets the responsiveness of the individual menu parts
-        :param enabled: whether menus should be enabled or not
-        :return:
-        """
-        # self.preview.setEnabled(enabled)
-        self.load_menu.setEnabled(enabled)
-        self.sort_menu.setEnabled(enabled)
-        self.layout_menu.setEnabled(enabled)
-        self.crop_menu.setEnabled(enabled)
-        self.save_widget.setEnabled(enabled)
-
     @pyqtSlot(ImageFile)
     def set_current_image(self, file: ImageFile):
         self.current_image = file
@@ -126,6 +122,49 @@ class MainWindow(QMainWindow):
             if f.height > self.max_image_height:
                 self.max_image_height = f.height
 
+    @pyqtSlot(str)
+    def save_session(self, path: str):
+        """
+        write the loaded files with their margins and all chosen options to a session file
+        :param path: path of the session file
+        :return:
+        """
+        try:
+            Session(self.files,
+                    self.sort_menu.sort_key,
+                    self.save_widget.double_pages,
+                    self.save_widget.right_to_left,
+                    self.save_widget.separate_cover,
+                    self.crop_menu.same_crop_for_all,
+                    self.save_widget.save_profiles,
+                    self.save_widget.long_strip,
+                    self.save_widget.cut_at_gaps).save(path)
+        except OSError as e:
+            QMessageBox.warning(self, 'PDF-Stitcher', f'The session could not be saved to {path}:\n{e}')
+
+    @pyqtSlot(str)
+    def load_session(self, path: str):
+        """
+        restore the files, margins and options of a session file; the images themselves are not opened here.
+        A session file that can't be read leaves the current files as they are
+        :param path: path of the session file
+        :return:
+        """
+        try:
+            session = Session.load(path)
+        except (OSError, ValueError, KeyError) as e:
+            QMessageBox.warning(self, 'PDF-Stitcher', f'The session {path} could not be opened:\n{e}')
+            return
+        self.load_files(session.files)
+        self.sort_menu.set_sort_key(session.sort_key)
+        self.layout_menu.set_layout(session.double_pages, session.right_to_left, session.separate_cover,
+                                    session.long_strip, session.cut_at_gaps)
+        self.crop_menu.set_same_for_all(session.same_crop_for_all)
+        self.crop_menu.restore_limits(self.max_image_width, self.max_image_height)
+        self.save_widget.set_save_profiles(session.save_profiles)
+        self.thumbnails.reset_files()
+        self.preview.go_to_index()
+
     def reset_files(self):
         """
         clears the list of loaded files
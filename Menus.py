@@ -4,30 +4,40 @@ from PyQt6.QtGui import QIcon
 from PyQt6.QtCore import QDir, QFileInfo, QSize, Qt, pyqtSignal, pyqtSlot
 
 
-from structures import SortKeys, ImageFile
+import os.path
+
+from structures import SortKeys, ImageFile, SaveOptions
 
 
 class LayoutMenu(QWidget):
     """
     Menu for the selection of the PDF files page layout
     """
-    selectionChanged = pyqtSignal(bool, bool)   # emits new Layout in format: double_pages, right_to_left
+    selectionChanged = pyqtSignal(bool, bool, bool)     # emits new Layout: double_pages, right_to_left, long_strip
     coverChecked = pyqtSignal(bool)     # emits state of separate cover checkbox
+    gapsChecked = pyqtSignal(bool)      # emits state of the checkbox for cutting long strips at gaps
 
     def __init__(self):
         super(LayoutMenu, self).__init__()
         lbl = QLabel('PDF layout: ')
 
         # define the image-layout pairs for the selection buttons
-        # layout: use_double_pages, right_to_left_direction
-        attributes = [('images/singlePageIcon.png', False, False),
-                      ('images/doublePageIcon1.png', True, False),
-                      ('images/doublePageIcon2.png', True, True)]
+        # layout: use_double_pages, right_to_left_direction, long_strip
+        self.attributes = attributes = [('images/singlePageIcon.png', False, False, False),
+                                        ('images/doublePageIcon1.png', True, False, False),
+                                        ('images/doublePageIcon2.png', True, True, False),
+                                        ('images/stripPageIcon.png', False, False, True)]
         self.buttons = list()
         self.selected_index = 0
 
-        cover_checkbox = QCheckBox('first image as separate cover')
-        cover_checkbox.stateChanged.connect(lambda b: self.coverChecked.emit(b))
+        self.cover_checkbox = QCheckBox('first image as separate cover')
+        self.cover_checkbox.stateChanged.connect(lambda b: self.coverChecked.emit(b))
+        self.gap_checkbox = QCheckBox('cut long strip at gaps')
+        self.gap_checkbox.setToolTip('end the pages of a long strip between panels or lines of text '
+                                     'instead of at a fixed height')
+        self.gap_checkbox.setChecked(True)
+        self.gap_checkbox.setEnabled(False)
+        self.gap_checkbox.stateChanged.connect(lambda b: self.gapsChecked.emit(b))
 
         btn_layout = QHBoxLayout()
         btn_layout.setAlignment(Qt.AlignmentFlag.AlignLeft)
@@ -35,7 +45,8 @@ class LayoutMenu(QWidget):
         layout = QVBoxLayout(self)
         layout.addWidget(lbl)
         layout.addLayout(btn_layout)
-        layout.addWidget(cover_checkbox)
+        layout.addWidget(self.cover_checkbox)
+        layout.addWidget(self.gap_checkbox)
 
         # create corresponding icon buttons for all attributes
         for i, attr in enumerate(attributes):
@@ -44,7 +55,8 @@ class LayoutMenu(QWidget):
             btn.setIconSize(QSize(32, 32))
             btn.setCheckable(True)
             btn.clicked.connect(lambda x, index=i: self.select_index(index))
-            btn.clicked.connect(lambda x, dp=attr[1], rl=attr[2]: self.selectionChanged.emit(dp, rl))
+            btn.clicked.connect(lambda x, dp=attr[1], rl=attr[2], ls=attr[3]: self.selectionChanged.emit(dp, rl, ls))
+            btn.setToolTip('join all images vertically and cut them into pages' if attr[3] else '')
             btn_layout.addWidget(btn)
             self.buttons.append(btn)
 
@@ -61,6 +73,25 @@ class LayoutMenu(QWidget):
             self.buttons[self.selected_index].setChecked(False)
             self.selected_index = index
             self.buttons[self.selected_index].setChecked(True)
+            self.gap_checkbox.setEnabled(self.attributes[index][3])
+
+    def set_layout(self, double_pages: bool, right_to_left: bool, separate_cover: bool, long_strip: bool = False,
+                   cut_at_gaps: bool = True):
+        """
+        select the button matching the given layout and send the corresponding signals
+        :param double_pages: whether two images share a page
+        :param right_to_left: reading direction of double pages
+        :param separate_cover: whether the first image gets a page of its own
+        :param long_strip: whether all images are joined vertically and cut into pages
+        :param cut_at_gaps: whether the pages of a long strip end at gaps in the content
+        :return:
+        """
+        for i, attr in enumerate(self.attributes):
+            if attr[3] == long_strip and attr[1] == double_pages and (attr[2] == right_to_left or not double_pages):
+                self.buttons[i].click()
+                break
+        self.cover_checkbox.setChecked(separate_cover)
+        self.gap_checkbox.setChecked(cut_at_gaps)
 
 
 class LoadMenu(QWidget):
@@ -68,24 +99,38 @@ class LoadMenu(QWidget):
     Menu for loading the images from files
     """
     loadedFiles = pyqtSignal(list)  # emits ImageFile list of new loaded files
+    sessionOpened = pyqtSignal(str)     # emits path of a session file to restore
+    sessionSaved = pyqtSignal(str)      # emits path the current session should be written to
 
     def __init__(self):
         super(LoadMenu, self).__init__()
-        self.supported_extensions = ['*.jpg', '*.jpeg', '*.png', '*.bmp', '*.webp']
+        self.supported_extensions = ['*.jpg', '*.jpeg', '*.png', '*.bmp', '*.webp', '*.tif', '*.tiff', '*.gif']
+        self.session_filter = 'PDF-Stitcher Sessions (*.stitch)'
         load_dir_btn = QPushButton('load from folder')
         load_files_btn = QPushButton('load from files')
+        open_session_btn = QPushButton('open session')
+        save_session_btn = QPushButton('save session')
 
         load_dir_btn.clicked.connect(self.load_by_dir)
         load_files_btn.clicked.connect(self.load_by_files)
+        open_session_btn.clicked.connect(self.open_session)
+        save_session_btn.clicked.connect(self.save_session)
+
+        session_layout = QHBoxLayout()
+        session_layout.setContentsMargins(0, 0, 0, 0)
+        session_layout.addWidget(open_session_btn)
+        session_layout.addWidget(save_session_btn)
 
         layout = QVBoxLayout(self)
         layout.addWidget(load_dir_btn)
         layout.addWidget(load_files_btn)
+        layout.addLayout(session_layout)
 
     @pyqtSlot()
     def load_by_dir(self):
         """
-        get a directory and load all image files (jpg, png, bmp) from it in ImageFile format
+        get a directory and load all image files (jpg, png, bmp, tiff, ...) from it in ImageFile format,
+        one for every page of multi-page files
         :return:
         """
         selected_path = QFileDialog.getExistingDirectory(self, 'Select Folder')
@@ -94,7 +139,7 @@ class LoadMenu(QWidget):
             directory = QDir(selected_path)
             file_infos = directory.entryInfoList(self.supported_extensions, QDir.Filter.Files)
             for file in file_infos:
-                files.append(ImageFile(file))
+                files.extend(ImageFile.frames(file))
             self.loadedFiles.emit(files)
 
     @pyqtSlot()
@@ -108,9 +153,21 @@ class LoadMenu(QWidget):
         if filenames[0]:
             files = list()
             for file in filenames[0]:
-                files.append(ImageFile(QFileInfo(file)))
+                files.extend(ImageFile.frames(QFileInfo(file)))
             self.loadedFiles.emit(files)
 
+    @pyqtSlot()
+    def open_session(self):
+        filename = QFileDialog.getOpenFileName(self, 'Open Session', '', self.session_filter)[0]
+        if filename:
+            self.sessionOpened.emit(filename)
+
+    @pyqtSlot()
+    def save_session(self):
+        filename = QFileDialog.getSaveFileName(self, 'Save Session', '', self.session_filter)[0]
+        if filename:
+            self.sessionSaved.emit(filename)
+
 
 class SortMenu(QWidget):
     """
@@ -123,28 +180,39 @@ class SortMenu(QWidget):
         self.files = files
         self.sort_key = SortKeys.CREATE_DATE
         lbl = QLabel('sort by: ')
-        selection = QComboBox()
+        self.selection = QComboBox()
         for key in SortKeys:
-            selection.addItem(key.value)
-        selection.setSizePolicy(QSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed))
-        selection.currentTextChanged.connect(lambda t: self.sort_files(SortKeys(t)))
+            self.selection.addItem(key.value)
+        self.selection.setSizePolicy(QSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed))
+        self.selection.currentTextChanged.connect(lambda t: self.sort_files(SortKeys(t)))
 
         layout = QHBoxLayout(self)
         layout.addWidget(lbl)
-        layout.addWidget(selection)
+        layout.addWidget(self.selection)
+
+        self.sort_key = SortKeys(self.selection.itemText(0))    # set sort key to default of selection
 
-        self.sort_key = SortKeys(selection.itemText(0))     # set sort key to default of selection
+    def set_sort_key(self, key: SortKeys):
+        """
+        show the given sort key as selected without sorting the files again
+        :param key: SortKey
+        :return:
+        """
+        self.sort_key = key
+        self.selection.blockSignals(True)
+        self.selection.setCurrentText(key.value)
+        self.selection.blockSignals(False)
 
     @pyqtSlot(SortKeys)
     def sort_files(self, key: SortKeys = None):
         if key is not None:
             self.sort_key = key
         if self.sort_key == SortKeys.NAME:
-            self.files.sort(key=lambda f: f.name.lower())
+            self.files.sort(key=lambda f: (f.name.lower(), f.absolute_path, f.frame))
         if self.sort_key == SortKeys.CREATE_DATE:
-            self.files.sort(key=lambda f: f.create_timestamp)
+            self.files.sort(key=lambda f: (f.create_timestamp, f.absolute_path, f.frame))
         if self.sort_key == SortKeys.LAST_MODIFIED:
-            self.files.sort(key=lambda f: f.last_modified)
+            self.files.sort(key=lambda f: (f.last_modified, f.absolute_path, f.frame))
         self.selectionChanged.emit(self.sort_key)
 
 
@@ -194,10 +262,10 @@ class CropMenu(QWidget):
         layout.setAlignment(Qt.AlignmentFlag.AlignTop)
         layout.addWidget(QLabel('set crop margins:'), 0, 0, 1, 2)
 
-        same_crop_btn = QCheckBox('use same crop margins for all')
-        same_crop_btn.setChecked(self.same_crop_for_all)
-        same_crop_btn.stateChanged.connect(self.__toggle_same_for_all)
-        layout.addWidget(same_crop_btn, 1, 0, 1, 2)
+        self.same_crop_btn = QCheckBox('use same crop margins for all')
+        self.same_crop_btn.setChecked(self.same_crop_for_all)
+        self.same_crop_btn.stateChanged.connect(self.__toggle_same_for_all)
+        layout.addWidget(self.same_crop_btn, 1, 0, 1, 2)
 
         left_lbl = QLabel('Left: ')
         left_lbl.setSizePolicy(QSizePolicy.Policy.Fixed, QSizePolicy.Policy.Preferred)
@@ -244,6 +312,30 @@ class CropMenu(QWidget):
                                  self.right_margin, self.bottom_margin,
                                  self.same_crop_for_all)
 
+    def set_same_for_all(self, same_for_all: bool):
+        """
+        set whether margins apply to all files without overwriting the margins of the loaded files
+        :param same_for_all: new state of the checkbox
+        :return:
+        """
+        self.same_crop_btn.blockSignals(True)
+        self.same_crop_btn.setChecked(same_for_all)
+        self.same_crop_btn.blockSignals(False)
+        self.same_crop_for_all = same_for_all
+
+    def restore_limits(self, width: int, height: int):
+        """
+        set new maximum limits for the edit fields while keeping the margins of the loaded files
+        :param width: new maximum width
+        :param height: new maximum height
+        :return:
+        """
+        for edt, maximum in ((self.left_edt, width), (self.right_edt, width),
+                             (self.top_edt, height), (self.bottom_edt, height)):
+            edt.blockSignals(True)
+            edt.setMaximum(maximum)
+            edt.blockSignals(False)
+
     @pyqtSlot(int, int)
     def set_limits(self, width: int, height: int):
         """
@@ -282,3 +374,143 @@ class CropMenu(QWidget):
         self.left_edt.blockSignals(False)
         self.right_edt.blockSignals(False)
         self.top_edt.blockSignals(False)
+
+
+class SaveWidget(QWidget):
+    """
+    Menu that handles the PDF formatting and queues the exports; the files are copied for every export,
+    so editing can go on while it runs. The saving machinery is only loaded once it is first needed
+    """
+    def __init__(self, files: list[ImageFile]):
+        super(SaveWidget, self).__init__()
+        self.files = files
+        self.right_to_left = False
+        self.double_pages = False
+        self.separate_cover = False
+        self.long_strip = False
+        self.cut_at_gaps = True
+        self.save_profiles = [SaveOptions()]    # options used for the last PDFs
+        self.export_queue = None
+        self.pre_encoder = None
+        self.running_exports = 0
+
+        self.save_btn = QPushButton('create PDF')
+        self.prepare_check = QCheckBox('prepare pages in background')
+        self.prepare_check.setToolTip('encode the pages with the last used save options while you review them, '
+                                      'so creating the PDF takes only a moment')
+        self.prepare_check.stateChanged.connect(self.set_prepare_pages)
+        self.job_layout = QVBoxLayout()
+        self.job_layout.setContentsMargins(0, 0, 0, 0)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.save_btn)
+        layout.addWidget(self.prepare_check)
+        layout.addLayout(self.job_layout)
+        self.save_btn.clicked.connect(self.open_save_dialog)
+
+    def open_save_dialog(self):
+        if self.files:
+            from Saving import SaveDialog
+            dialog = SaveDialog(os.path.dirname(self.files[0].absolute_path), self.save_profiles, self.files)
+            dialog.confirmedProfiles.connect(self.save_pdf)
+            dialog.exec()
+
+    @pyqtSlot(int)
+    def set_prepare_pages(self, prepare: int):
+        """
+        start or stop encoding the pages in the background
+        :param prepare: state of the checkbox
+        :return:
+        """
+        if prepare and self.pre_encoder is None:
+            from Saving import PreEncoder
+            self.pre_encoder = PreEncoder(self.files)
+            self.pre_encoder.set_profiles(self.save_profiles)
+            self.__update_pre_encoder()
+        elif not prepare and self.pre_encoder is not None:
+            self.pre_encoder.stop()
+            self.pre_encoder = None
+
+    @pyqtSlot()
+    def files_changed(self):
+        """
+        restart the background encoding after files were loaded, reordered or cropped
+        :return:
+        """
+        if self.pre_encoder is not None:
+            self.pre_encoder.schedule()
+
+    @pyqtSlot(ImageFile, int)
+    def set_current_file(self, file: ImageFile, index: int):
+        if self.pre_encoder is not None:
+            self.pre_encoder.set_current_file(file)
+
+    def __update_pre_encoder(self):
+        # the pages of a long strip are cut across files and can't be prepared one file at a time
+        if self.pre_encoder is not None:
+            if self.running_exports or self.long_strip:
+                self.pre_encoder.pause()
+            else:
+                self.pre_encoder.resume()
+
+    @pyqtSlot()
+    def export_done(self):
+        self.running_exports -= 1
+        self.__update_pre_encoder()
+
+    @pyqtSlot(bool)
+    def set_separate_cover(self, separate_cover: bool):
+        self.separate_cover = separate_cover
+
+    @pyqtSlot(bool)
+    def set_cut_at_gaps(self, cut_at_gaps: bool):
+        self.cut_at_gaps = bool(cut_at_gaps)
+
+    @pyqtSlot(bool, bool, bool)
+    def set_pdf_layout(self, double_pages: bool, right_to_left: bool, long_strip: bool):
+        self.double_pages = double_pages
+        self.right_to_left = right_to_left
+        self.long_strip = long_strip
+        self.__update_pre_encoder()
+
+    @pyqtSlot()
+    def hide_progress(self):
+        """
+        remove the progress views of finished exports
+        :return:
+        """
+        for i in reversed(range(self.job_layout.count())):
+            widget = self.job_layout.itemAt(i).widget()
+            if widget.done:
+                self.job_layout.removeWidget(widget)
+                widget.deleteLater()
+
+    @pyqtSlot(list)
+    def set_save_profiles(self, profiles: list[SaveOptions]):
+        self.save_profiles = profiles
+        if self.pre_encoder is not None:
+            self.pre_encoder.set_profiles(profiles)
+
+    @pyqtSlot(list)
+    def save_pdf(self, profiles: list[SaveOptions]):
+        """
+        queue an export of the current files with the profiles confirmed in the SaveDialog
+        :param profiles: SaveOptions for each of the PDFs
+        :return:
+        """
+        if self.files:
+            from Saving import SavingRunnable, ExportQueue, ExportJobWidget
+            if self.export_queue is None:
+                self.export_queue = ExportQueue()
+            self.set_save_profiles(profiles)
+            encoding_cache = self.pre_encoder.cache if self.pre_encoder is not None else None
+            saving = SavingRunnable([f.copy() for f in self.files], profiles,
+                                    self.separate_cover, self.right_to_left, self.double_pages,
+                                    long_strip=self.long_strip, cut_at_gaps=self.cut_at_gaps,
+                                    encoding_cache=encoding_cache)
+            saving.signal.finished.connect(self.export_done)
+            saving.signal.failed.connect(self.export_done)
+            self.running_exports += 1
+            self.__update_pre_encoder()
+            self.job_layout.addWidget(ExportJobWidget(saving, self.export_queue))
+            self.export_queue.submit(saving)
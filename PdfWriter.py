@@ -0,0 +1,858 @@
+from PIL import Image, PdfParser, features
+import io
+import math
+import mmap
+import re
+import zlib
+import time
+import os.path
+import hashlib
+import tempfile
+
+
+class EncodedImage:
+    """
+    Image data that is already encoded in a PDF compatible format and can be embedded as image XObject.
+    Only the part inside the crop box is shown on the page, the rest is clipped away by the PDF viewer
+    """
+    def __init__(self, stream: bytes, width: int, height: int, pdf_filter: str, color_space: str,
+                 bits_per_component: int = 8, decode_parms: dict = None):
+        self.stream = stream
+        self.width = width
+        self.height = height
+        self.filter = pdf_filter
+        self.color_space = color_space
+        self.bits_per_component = bits_per_component
+        self.decode_parms = decode_parms
+        self.crop_box = (0, 0, width, height)
+
+    @property
+    def shown_width(self):
+        return self.crop_box[2] - self.crop_box[0]
+
+    @property
+    def shown_height(self):
+        return self.crop_box[3] - self.crop_box[1]
+
+    def is_cropped(self):
+        return self.crop_box != (0, 0, self.width, self.height)
+
+    def xobject_dict(self):
+        """
+        create the dictionary entries describing the image XObject
+        :return: dict of PDF object entries
+        """
+        decode_parms = None
+        if self.decode_parms is not None:
+            decode_parms = PdfParser.PdfDict(self.decode_parms)
+        return dict(Type=PdfParser.PdfName('XObject'),
+                    Subtype=PdfParser.PdfName('Image'),
+                    Width=self.width,
+                    Height=self.height,
+                    Filter=PdfParser.PdfName(self.filter),
+                    BitsPerComponent=self.bits_per_component,
+                    ColorSpace=PdfParser.PdfName(self.color_space),
+                    DecodeParms=decode_parms)
+
+
+class ImagePlacement:
+    """
+    Position of an embedded image on a page; all values are in pixels with the origin in the top left corner.
+    If a clip rectangle (x, y, width, height) is given, only the image content inside of it is visible
+    """
+    def __init__(self, image_ref, x: float, y: float, width: float, height: float, clip: tuple = None):
+        self.image_ref = image_ref
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.clip = clip
+
+    @classmethod
+    def from_image(cls, image_ref, image: EncodedImage, x: float, y: float):
+        """
+        place the visible part of an encoded image with its top left corner at x, y
+        :param image_ref: reference to the written image object
+        :param image: EncodedImage that is referenced
+        :param x: horizontal position of the visible part
+        :param y: vertical position of the visible part
+        :return: ImagePlacement
+        """
+        left, top = image.crop_box[:2]
+        clip = (x, y, image.shown_width, image.shown_height) if image.is_cropped() else None
+        return cls(image_ref, x - left, y - top, image.width, image.height, clip)
+
+
+def encode_image(img: Image.Image, optimize: bool = False, quality: int = 75) -> EncodedImage:
+    """
+    encode a PIL image for embedding into a PDF; color and grayscale images are stored as JPEG like Pillow does
+    :param img: image to encode
+    :param optimize: whether the encoder should spend extra effort on reducing the size
+    :param quality: JPEG quality from 1 to 95, Pillow's default is 75
+    :return: EncodedImage
+    """
+    if img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    op = io.BytesIO()
+    img.save(op, 'JPEG', optimize=optimize, quality=quality)
+    color_space = 'DeviceGray' if img.mode == 'L' else 'DeviceRGB'
+    return EncodedImage(op.getvalue(), img.width, img.height, 'DCTDecode', color_space)
+
+
+def encode_image_lossless(img: Image.Image, compress_lvl: int = 6) -> EncodedImage:
+    """
+    encode a PIL image for embedding into a PDF without losing any information; black and white images keep
+    their packed 1 bit pixels
+    :param img: image to encode
+    :param compress_lvl: zlib compression level, values above 9 are treated as 9
+    :return: EncodedImage
+    """
+    if img.mode not in ('RGB', 'L', '1'):
+        img = img.convert('RGB')
+    stream = zlib.compress(img.tobytes(), max(0, min(compress_lvl, 9)))
+    color_space = 'DeviceRGB' if img.mode == 'RGB' else 'DeviceGray'
+    return EncodedImage(stream, img.width, img.height, 'FlateDecode', color_space, 1 if img.mode == '1' else 8)
+
+
+def encode_image_bilevel(img: Image.Image) -> EncodedImage:
+    """
+    encode a black and white image with CCITT Group 4 compression like Pillow does; if Pillow lacks libtiff
+    the packed pixels are compressed with zlib instead
+    :param img: image to encode, converted to mode '1' if necessary
+    :return: EncodedImage
+    """
+    if img.mode != '1':
+        img = img.convert('1')
+    if not features.check('libtiff'):
+        return encode_image_lossless(img, 9)
+
+    op = io.BytesIO()
+    img.save(op, 'TIFF', compression='group4', strip_size=math.ceil(img.width / 8) * img.height)   # single strip
+    with Image.open(op) as tiff:
+        offset = tiff.tag_v2[273][0]    # StripOffsets
+        length = tiff.tag_v2[279][0]    # StripByteCounts
+        black_is_1 = tiff.tag_v2.get(262) == 1     # PhotometricInterpretation BlackIsZero inverts the fax bits
+    stream = op.getvalue()[offset:offset + length]
+    decode_parms = {'K': -1, 'BlackIs1': black_is_1, 'Columns': img.width, 'Rows': img.height}
+    return EncodedImage(stream, img.width, img.height, 'CCITTFaxDecode', 'DeviceGray', 1, decode_parms)
+
+
+def encode_file(path: str) -> EncodedImage | None:
+    """
+    wrap the content of a JPEG file as DCT stream without decoding and re-encoding the image
+    :param path: path of the image file
+    :return: EncodedImage or None if the file can't be embedded as it is
+    """
+    with Image.open(path, 'r') as img:
+        if img.format != 'JPEG' or img.mode not in ('RGB', 'L'):
+            return None
+        width, height = img.size
+        color_space = 'DeviceGray' if img.mode == 'L' else 'DeviceRGB'
+    with open(path, 'rb') as f:
+        stream = f.read()
+    return EncodedImage(stream, width, height, 'DCTDecode', color_space)
+
+
+class PdfWriter:
+    """
+    Writes a PDF file page by page from encoded images, so pages never have to be merged into a single raster.
+    Built on the PdfParser shipped with Pillow
+    """
+    compress_contents = False   # whether page content streams are Flate compressed
+
+    def __init__(self, filename: str, resolution: int = 300):
+        self.filename = filename
+        self.resolution = resolution
+        self.pages = list()
+        self.info = PdfParser.PdfDict(Title=os.path.splitext(os.path.basename(filename))[0],
+                                      CreationDate=time.gmtime())
+        self._next_id = 1
+        self._page_ref = None   # reserved reference of the page currently being assembled
+        self._start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._abort()
+        return False
+
+    def _start(self):
+        self.pdf = PdfParser.PdfParser(filename=self.filename, mode='w+b')
+        self.pdf.start_writing()
+        self.pdf.write_header()
+        self.pdf.write_comment('created by PDF-Stitcher')
+        self.pages_ref = self._next_ref()
+
+    def _abort(self):
+        self.pdf.close()
+
+    def _next_ref(self):
+        # keep track of the ids here, PdfParser searches its whole xref table for every new id
+        ref = PdfParser.IndirectReference(self._next_id, 0)
+        self._next_id += 1
+        return ref
+
+    def _current_page_ref(self):
+        # the page object is numbered before the objects it uses, as the hint tables of linearized files require
+        if self._page_ref is None:
+            self._page_ref = self._next_ref()
+        return self._page_ref
+
+    def _write_obj(self, ref, stream: bytes = None, **dict_obj):
+        return self.pdf.write_obj(ref, stream=stream, **dict_obj)
+
+    def _write_page(self, ref, **dict_obj):
+        return self._write_obj(ref, Type=PdfParser.PdfName('Page'), Parent=self.pages_ref, **dict_obj)
+
+    def __to_points(self, value: float):
+        return value * 72.0 / self.resolution
+
+    def add_image(self, image: EncodedImage):
+        """
+        write the image as XObject into the file
+        :param image: encoded image data
+        :return: reference to the written object
+        """
+        self._current_page_ref()
+        return self._write_obj(self._next_ref(), stream=image.stream, **image.xobject_dict())
+
+    def add_page(self, width: float, height: float, placements: list[ImagePlacement]):
+        """
+        write a new page showing the given image placements
+        :param width: page width in pixels
+        :param height: page height in pixels
+        :param placements: images and where to draw them on the page
+        :return:
+        """
+        page_ref = self._current_page_ref()
+        xobjects = dict()
+        contents = list()
+        for i, p in enumerate(placements):
+            name = f'Im{i}'
+            xobjects[name] = p.image_ref
+            clip = b''
+            if p.clip is not None:
+                x, y, w, h = p.clip
+                clip = b'%f %f %f %f re W n ' % (self.__to_points(x), self.__to_points(height - y - h),
+                                                 self.__to_points(w), self.__to_points(h))
+            # PDF coordinates start in the bottom left corner
+            contents.append(b'q %s%f 0 0 %f %f %f cm /%s Do Q\n' % (clip,
+                                                                    self.__to_points(p.width),
+                                                                    self.__to_points(p.height),
+                                                                    self.__to_points(p.x),
+                                                                    self.__to_points(height - p.y - p.height),
+                                                                    name.encode()))
+
+        contents = b''.join(contents)
+        if self.compress_contents:
+            contents_ref = self._write_obj(self._next_ref(), stream=zlib.compress(contents),
+                                           Filter=PdfParser.PdfName('FlateDecode'))
+        else:
+            contents_ref = self._write_obj(self._next_ref(), stream=contents)
+        self._write_page(page_ref,
+                         Resources=PdfParser.PdfDict(
+                             ProcSet=[PdfParser.PdfName('PDF'),
+                                      PdfParser.PdfName('ImageB'),
+                                      PdfParser.PdfName('ImageC')],
+                             XObject=PdfParser.PdfDict(xobjects)),
+                         MediaBox=[0, 0, self.__to_points(width), self.__to_points(height)],
+                         Contents=contents_ref)
+        self.pages.append(page_ref)
+        self._page_ref = None
+
+    def close(self):
+        """
+        write the page tree, catalog and cross-reference table and close the file
+        :return:
+        """
+        self._write_obj(self.pages_ref,
+                        Type=PdfParser.PdfName('Pages'),
+                        Count=len(self.pages),
+                        Kids=self.pages)
+        self.pdf.root_ref = self._write_obj(self._next_ref(),
+                                            Type=PdfParser.PdfName('Catalog'),
+                                            Pages=self.pages_ref)
+        self.pdf.info = self.info
+        self.pdf.write_xref_and_trailer()
+        self.pdf.f.flush()
+        self.pdf.close()
+
+
+class _FixedWidthInt:
+    """
+    integer that is always written with the same number of digits, so objects keep their size when values change
+    """
+    def __init__(self, value: int):
+        self.value = value
+
+    def __bytes__(self):
+        return b'%010d' % self.value
+
+
+class _BitWriter:
+    """
+    packs unsigned integers of arbitrary bit width, most significant bit first, as needed for hint tables
+    """
+    def __init__(self):
+        self.data = bytearray()
+        self.value = 0
+        self.bits = 0
+
+    def write(self, value: int, bits: int):
+        if bits == 0:
+            return
+        self.value = (self.value << bits) | value
+        self.bits += bits
+        while self.bits >= 8:
+            self.bits -= 8
+            self.data.append((self.value >> self.bits) & 0xff)
+        self.value &= (1 << self.bits) - 1
+
+    def write_all(self, values, bits: int):
+        """
+        write the values and pad to the next byte boundary, which every item of a hint table has to start on
+        """
+        for v in values:
+            self.write(v, bits)
+        if self.bits:
+            self.write(0, 8 - self.bits)
+
+
+def _nbits(value: int):
+    return value.bit_length()
+
+
+def _xref_stream_data(entries: list[tuple], offset_width: int):
+    return b''.join(t.to_bytes(1, 'big') + f2.to_bytes(offset_width, 'big') + f3.to_bytes(2, 'big')
+                    for t, f2, f3 in entries)
+
+
+class LinearizedPdfWriter(PdfWriter):
+    """
+    PdfWriter for "fast web view" files. Objects are spooled to a temporary file and arranged on close, so that
+    the first page directly follows a small header and can be shown after a single range request, and hint tables
+    tell viewers where the other pages start. Cross references are compressed streams and the page tree and
+    document information are packed into a compressed object stream
+    """
+    compress_contents = True
+
+    def _start(self):
+        # the spool lives next to the target, the temporary directory might not have room for large documents
+        self.spool = tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(self.filename)))
+        self.objects = dict()   # object number -> offset and length in the spool
+        self.page_dicts = dict()    # object number -> entries of page objects, written on close
+        self.page_groups = [[]]     # object numbers written for each page
+        # the page tree is stored in an object stream, where objects have to be numbered after all uncompressed
+        # ones, so its number is only assigned on close; the other objects arranged on close get the lowest numbers
+        self.pages_ref = None
+        self.linearization_ref = self._next_ref()
+        self.first_xref_ref = self._next_ref()
+        self.catalog_ref = self._next_ref()
+        self.hint_ref = self._next_ref()
+
+    def _abort(self):
+        self.spool.close()
+
+    def _write_obj(self, ref, stream: bytes = None, **dict_obj):
+        offset = self.spool.tell()
+        self.spool.write(bytes(PdfParser.IndirectObjectDef(*ref)))
+        if stream is not None:
+            dict_obj['Length'] = len(stream)
+        self.spool.write(PdfParser.pdf_repr(dict_obj))
+        if stream is not None:
+            self.spool.write(b'stream\n')
+            self.spool.write(stream)
+            self.spool.write(b'\nendstream\n')
+        self.spool.write(b'endobj\n')
+        self.objects[ref.object_id] = (offset, self.spool.tell() - offset)
+        self.page_groups[-1].append(ref.object_id)
+        return ref
+
+    def _write_page(self, ref, **dict_obj):
+        self.page_dicts[ref.object_id] = dict_obj
+        self.page_groups[-1].append(ref.object_id)
+        return ref
+
+    def add_page(self, width: float, height: float, placements: list[ImagePlacement]):
+        super(LinearizedPdfWriter, self).add_page(width, height, placements)
+        self.page_groups.append([])
+
+    @staticmethod
+    def __serialize(ref, stream: bytes = None, **dict_obj):
+        if stream is not None:
+            dict_obj['Length'] = len(stream)
+        data = [bytes(PdfParser.IndirectObjectDef(*ref)), PdfParser.pdf_repr(dict_obj)]
+        if stream is not None:
+            data.extend((b'stream\n', stream, b'\nendstream\n'))
+        data.append(b'endobj\n')
+        return b''.join(data)
+
+    @staticmethod
+    def __hint_tables(first_page_offset: int, page_lengths: list[int], page_object_counts: list[int],
+                      first_page_object_lengths: list[int]):
+        """
+        create the page offset and shared object hint tables; pages don't share any objects here, so the shared
+        object table only lists the objects of the first page
+        :return: hint stream data, offset of the shared object hint table within it
+        """
+        w = _BitWriter()
+        min_objects, max_objects = min(page_object_counts), max(page_object_counts)
+        min_length, max_length = min(page_lengths), max(page_lengths)
+        length_bits = _nbits(max_length - min_length)
+        header = ((min_objects, 32), (first_page_offset, 32), (_nbits(max_objects - min_objects), 16),
+                  (min_length, 32), (length_bits, 16),
+                  (0, 32), (0, 16),     # content streams are counted from the start of their page
+                  (min_length, 32), (length_bits, 16),
+                  (0, 16),      # number of shared object references
+                  (_nbits(len(first_page_object_lengths)), 16),
+                  (0, 16), (4, 16))     # numerator bits and denominator of shared object positions
+        for value, bits in header:
+            w.write(value, bits)
+        w.write_all((n - min_objects for n in page_object_counts), _nbits(max_objects - min_objects))
+        w.write_all((n - min_length for n in page_lengths), length_bits)
+        w.write_all((), 0)    # no shared object references, identifiers and numerators
+        w.write_all((0 for _ in page_lengths), 0)
+        w.write_all((n - min_length for n in page_lengths), length_bits)
+        shared_offset = len(w.data)
+
+        min_group, max_group = min(first_page_object_lengths), max(first_page_object_lengths)
+        group_bits = _nbits(max_group - min_group)
+        header = ((0, 32), (0, 32),     # there is no shared object section after the first page
+                  (len(first_page_object_lengths), 32), (len(first_page_object_lengths), 32),
+                  (0, 16),      # every group consists of one object
+                  (min_group, 32), (group_bits, 16))
+        for value, bits in header:
+            w.write(value, bits)
+        w.write_all((n - min_group for n in first_page_object_lengths), group_bits)
+        w.write_all((0 for _ in first_page_object_lengths), 1)    # no MD5 signatures
+        return bytes(w.data), shared_offset
+
+    def close(self):
+        """
+        arrange all objects in linearized order and write them together with hint tables and
+        cross-reference streams into the target file
+        :return:
+        """
+        if not self.pages:
+            self.spool.close()
+            raise ValueError('a linearized PDF needs at least one page')
+        groups = [sorted(g) for g in self.page_groups if g]
+        first_group = groups[0]
+        object_stream_ref = self._next_ref()
+        main_xref_ref = self._next_ref()
+        self.pages_ref = self._next_ref()
+        info_ref = self._next_ref()
+        size = self._next_id
+        spool_size = self.spool.tell()
+        offset_width = max(4, (spool_size + 2**20).bit_length() // 8 + 1)
+        doc_id = PdfParser.PdfBinary(hashlib.md5(f'{self.filename}{time.time()}{spool_size}'.encode()).digest())
+        name = PdfParser.PdfName
+
+        page_data = {n: self.__serialize(PdfParser.IndirectReference(n, 0),
+                                         Type=name('Page'), Parent=self.pages_ref, **d)
+                     for n, d in self.page_dicts.items()}
+        lengths = {n: len(d) for n, d in page_data.items()}
+        lengths.update({n: length for n, (offset, length) in self.objects.items()})
+
+        # page tree and document information are only needed after the first page
+        objects = [PdfParser.pdf_repr(PdfParser.PdfDict(Type=name('Pages'), Count=len(self.pages), Kids=self.pages)),
+                   PdfParser.pdf_repr(self.info)]
+        header = b'%d 0 %d %d ' % (self.pages_ref.object_id, info_ref.object_id, len(objects[0]) + 1)
+        object_stream = self.__serialize(object_stream_ref, stream=zlib.compress(header + b'\n'.join(objects)),
+                                         Type=name('ObjStm'), N=2, First=len(header), Filter=name('FlateDecode'))
+        catalog = self.__serialize(self.catalog_ref, Type=name('Catalog'), Pages=self.pages_ref)
+
+        def linearization_dict(length=0, hint_offset=0, hint_length=0, first_page_end=0, main_xref_offset=0):
+            return self.__serialize(self.linearization_ref,
+                                    Linearized=1,
+                                    L=_FixedWidthInt(length),
+                                    H=[_FixedWidthInt(hint_offset), _FixedWidthInt(hint_length)],
+                                    O=self.pages[0].object_id,
+                                    E=_FixedWidthInt(first_page_end),
+                                    N=len(self.pages),
+                                    T=_FixedWidthInt(main_xref_offset - 1))
+
+        first_xref_start = self.linearization_ref.object_id
+
+        def first_xref(offsets=None, main_xref_offset=0):
+            count = first_group[-1] - first_xref_start + 1
+            entries = [(1, offsets.get(first_xref_start + i, 0) if offsets else 0, 0) for i in range(count)]
+            return self.__serialize(self.first_xref_ref,
+                                    stream=_xref_stream_data(entries, offset_width),
+                                    Type=name('XRef'),
+                                    Size=size,
+                                    Index=[first_xref_start, count],
+                                    W=[1, offset_width, 2],
+                                    Root=self.catalog_ref,
+                                    Info=info_ref,
+                                    ID=[doc_id, doc_id],
+                                    Prev=_FixedWidthInt(main_xref_offset))
+
+        # determine where everything goes, all numbers that depend on the layout have a fixed width
+        file_header = b'%PDF-1.5\n%\xbf\xf7\xa2\xfe\n'
+        offsets = dict()
+        offsets[self.linearization_ref.object_id] = len(file_header)
+        offsets[self.first_xref_ref.object_id] = offsets[self.linearization_ref.object_id] + len(linearization_dict())
+        offsets[self.catalog_ref.object_id] = offsets[self.first_xref_ref.object_id] + len(first_xref())
+        hint_offset = offsets[self.catalog_ref.object_id] + len(catalog)
+
+        # hint tables give offsets as if the hint stream wasn't there, so the first page starts at the hint offset
+        page_lengths = [sum(lengths[n] for n in g) for g in groups]
+        hint_data, shared_offset = self.__hint_tables(hint_offset, page_lengths, [len(g) for g in groups],
+                                                      [lengths[n] for n in first_group])
+        hint = self.__serialize(self.hint_ref, stream=zlib.compress(hint_data),
+                                Filter=name('FlateDecode'), S=shared_offset)
+        offsets[self.hint_ref.object_id] = hint_offset
+        position = hint_offset + len(hint)
+        for g in groups:
+            for n in g:
+                offsets[n] = position
+                position += lengths[n]
+            if g is first_group:
+                first_page_end = position
+        offsets[object_stream_ref.object_id] = position
+        main_xref_offset = position + len(object_stream)
+        offsets[main_xref_ref.object_id] = main_xref_offset
+
+        main_start = first_group[-1] + 1
+        entries = [(0, 0, 65535)]
+        entries += [(1, offsets[n], 0) for n in range(main_start, self.pages_ref.object_id)]
+        entries += [(2, object_stream_ref.object_id, 0), (2, object_stream_ref.object_id, 1)]
+        main_xref = self.__serialize(main_xref_ref,
+                                     stream=zlib.compress(_xref_stream_data(entries, offset_width)),
+                                     Type=name('XRef'),
+                                     Size=size,
+                                     Index=[0, 1, main_start, size - main_start],
+                                     W=[1, offset_width, 2],
+                                     Root=self.catalog_ref,
+                                     Info=info_ref,
+                                     ID=[doc_id, doc_id],
+                                     Filter=name('FlateDecode'))
+        trailer = b'startxref\n%d\n%%%%EOF\n' % offsets[self.first_xref_ref.object_id]
+        file_length = main_xref_offset + len(main_xref) + len(trailer)
+
+        with open(self.filename, 'wb') as f:
+            f.write(file_header)
+            f.write(linearization_dict(file_length, hint_offset, len(hint), first_page_end, main_xref_offset))
+            f.write(first_xref(offsets, main_xref_offset))
+            f.write(catalog)
+            f.write(hint)
+            for g in groups:
+                for n in g:
+                    if n in page_data:
+                        f.write(page_data[n])
+                    else:
+                        self.spool.seek(self.objects[n][0])
+                        f.write(self.spool.read(self.objects[n][1]))
+            f.write(object_stream)
+            f.write(main_xref)
+            f.write(trailer)
+        self.spool.close()
+
+
+_XREF_SUBSECTION = re.compile(rb'[\0\t\n\f\r ]*(\d+) +(\d+)[ \t]*\r?\n')
+_XREF_TRAILER = re.compile(rb'[\0\t\n\f\r ]*trailer')
+
+
+def _png_unpredict(data: bytes, columns: int):
+    """
+    undo the PNG predictors of a stream with one byte per pixel, as used by cross-reference streams
+    """
+    rows = list()
+    previous = bytes(columns)
+    for start in range(0, len(data), columns + 1):
+        kind, row = data[start], bytearray(data[start + 1:start + 1 + columns])
+        for i in range(len(row)):
+            left = row[i - 1] if i else 0
+            if kind == 1:
+                row[i] = (row[i] + left) & 0xff
+            elif kind == 2:
+                row[i] = (row[i] + previous[i]) & 0xff
+            elif kind == 3:
+                row[i] = (row[i] + (left + previous[i]) // 2) & 0xff
+            elif kind == 4:
+                up_left = previous[i - 1] if i else 0
+                p = left + previous[i] - up_left
+                pa, pb, pc = abs(p - left), abs(p - previous[i]), abs(p - up_left)
+                row[i] = (row[i] + (left if pa <= pb and pa <= pc else previous[i] if pb <= pc else up_left)) & 0xff
+        rows.append(bytes(row))
+        previous = row
+    return b''.join(rows)
+
+
+def _decode_stream(stream: PdfParser.PdfStream):
+    filters = stream.dictionary.get(b'Filter')
+    parms = stream.dictionary.get(b'DecodeParms')
+    if isinstance(filters, list):
+        if len(filters) > 1:
+            raise ValueError('streams with more than one filter are not supported')
+        filters = filters[0] if filters else None
+        parms = parms[0] if isinstance(parms, list) and parms else parms
+    if filters is None:
+        data = bytes(stream.buf)
+    elif filters == b'FlateDecode':
+        data = zlib.decompress(stream.buf)
+    else:
+        raise ValueError(f'unsupported stream filter {filters}')
+    predictor = parms.get(b'Predictor', 1) if parms else 1
+    if predictor >= 10:
+        return _png_unpredict(data, parms.get(b'Columns', 1))
+    if predictor != 1:
+        raise ValueError(f'unsupported predictor {predictor}')
+    return data
+
+
+def _binary_strings(value):
+    """
+    PdfParser returns strings as bytes or bytearray, which it wouldn't write back unchanged, as hex strings they are
+    """
+    if isinstance(value, (bytes, bytearray)):
+        return PdfParser.PdfBinary(bytes(value))
+    if isinstance(value, PdfParser.PdfDict):
+        return PdfParser.PdfDict({k: _binary_strings(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return [_binary_strings(v) for v in value]
+    return value
+
+
+class _ExistingPdf:
+    """
+    Reads single objects of an existing PDF file for an incremental update. The file is mapped into memory and only
+    the cross-reference sections on the way to a requested object are parsed, starting with the newest one, so the
+    size of the document hardly matters. Both cross-reference tables and streams as well as object streams are read
+    """
+    def __init__(self, f):
+        try:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise ValueError(f'{f.name} is empty') from None
+        self.sections = dict()  # offset -> trailer and entry lookup of a cross-reference section
+        self.object_streams = dict()    # object number -> decoded data and offsets of its objects
+        try:
+            if self.data[:5] != b'%PDF-':
+                raise ValueError(f'{f.name} is not a PDF file')
+            tail = self.data[-1024:]
+            start = tail.rfind(b'startxref')
+            if start < 0:
+                raise ValueError(f'{f.name} has no cross-reference table')
+            self.xref_offset = int(tail[start + 9:].split()[0])
+            self.trailer, _ = self.__section(self.xref_offset)
+            self.is_xref_stream = self.data[self.xref_offset:self.xref_offset + 4] != b'xref'
+            if b'Encrypt' in self.trailer:
+                raise ValueError(f'{f.name} is encrypted')
+            self.root_ref = self.trailer[b'Root']
+            self.size = self.trailer[b'Size']
+        except (PdfParser.PdfFormatError, KeyError, IndexError, TypeError) as e:
+            self.close()
+            raise ValueError(f'{f.name} could not be read: {e}') from e
+        except ValueError:
+            self.close()
+            raise
+
+    def close(self):
+        self.data.close()
+
+    def read(self, ref: PdfParser.IndirectReference):
+        """
+        read an object of the newest revision of the document
+        :param ref: reference to the object
+        :return: the parsed object, e.g. a PdfDict; strings are PdfBinary, so they can be written again
+        """
+        value = self.__read(ref)
+        return value if isinstance(value, PdfParser.PdfStream) else _binary_strings(value)
+
+    def __read(self, ref: PdfParser.IndirectReference):
+        try:
+            entry = self.__locate(ref.object_id)
+            if entry is None or entry[0] == 0:
+                raise ValueError(f'object {ref.object_id} is missing')
+            if entry[0] == 1:
+                return PdfParser.PdfParser.get_value(self.data, entry[1], expect_indirect=ref)[0]
+            data, offsets = self.__object_stream(entry[1])
+            return PdfParser.PdfParser.get_value(data, offsets[entry[2]])[0]
+        except (PdfParser.PdfFormatError, KeyError, IndexError, TypeError, zlib.error) as e:
+            raise ValueError(f'object {ref.object_id} could not be read: {e}') from e
+
+    def __locate(self, object_id: int):
+        offset, visited = self.xref_offset, set()
+        while offset is not None and offset not in visited:
+            visited.add(offset)
+            trailer, lookup = self.__section(offset)
+            entry = lookup(object_id)
+            if entry is None and b'XRefStm' in trailer:  # hybrid file, the stream lists the compressed objects
+                entry = self.__section(trailer[b'XRefStm'])[1](object_id)
+            if entry is not None:
+                return entry
+            offset = trailer.get(b'Prev')
+        return None
+
+    def __section(self, offset: int):
+        if offset not in self.sections:
+            if self.data[offset:offset + 4] == b'xref':
+                self.sections[offset] = self.__table_section(offset + 4)
+            else:
+                self.sections[offset] = self.__stream_section(offset)
+        return self.sections[offset]
+
+    def __table_section(self, position: int):
+        # entries have a fixed size, so they are only read when they are looked up
+        subsections = list()
+        while not _XREF_TRAILER.match(self.data, position):
+            m = _XREF_SUBSECTION.match(self.data, position)
+            if not m:
+                raise ValueError('damaged cross-reference table')
+            first, count = int(m.group(1)), int(m.group(2))
+            # some writers end entries with a single line break instead of two characters
+            entry_size = 20 if count == 0 or self.data[m.end() + 19] in b'\r\n' else 19
+            subsections.append((first, count, m.end(), entry_size))
+            position = m.end() + count * entry_size
+        trailer = PdfParser.PdfParser.get_value(self.data, _XREF_TRAILER.match(self.data, position).end())[0]
+
+        def lookup(object_id):
+            for first, count, start, entry_size in subsections:
+                if first <= object_id < first + count:
+                    entry = self.data[start + (object_id - first) * entry_size:][:18]
+                    return (1 if entry[17:18] == b'n' else 0), int(entry[:10]), int(entry[11:16])
+            return None
+        return trailer, lookup
+
+    def __stream_section(self, offset: int):
+        stream = PdfParser.PdfParser.get_value(self.data, offset)[0]
+        if not isinstance(stream, PdfParser.PdfStream) or stream.dictionary.get(b'Type') != b'XRef':
+            raise ValueError('damaged cross-reference stream')
+        widths = stream.dictionary[b'W']
+        index = stream.dictionary.get(b'Index', [0, stream.dictionary[b'Size']])
+        data = _decode_stream(stream)
+        row_size = sum(widths)
+        subsections = list()
+        position = 0
+        for first, count in zip(index[::2], index[1::2]):
+            subsections.append((first, count, position))
+            position += count * row_size
+
+        def lookup(object_id):
+            for first, count, start in subsections:
+                if first <= object_id < first + count:
+                    position = start + (object_id - first) * row_size
+                    fields = list()
+                    for width in widths:
+                        fields.append(int.from_bytes(data[position:position + width], 'big'))
+                        position += width
+                    if not widths[0]:   # the type defaults to uncompressed objects
+                        fields[0] = 1
+                    return tuple(fields)
+            return None
+        return stream.dictionary, lookup
+
+    def __object_stream(self, object_id: int):
+        if object_id not in self.object_streams:
+            stream = self.__read(PdfParser.IndirectReference(object_id, 0))
+            data = _decode_stream(stream)
+            first = stream.dictionary[b'First']
+            numbers = data[:first].split()
+            self.object_streams[object_id] = data, [first + int(n) for n in numbers[1::2]]
+        return self.object_streams[object_id]
+
+
+class AppendingPdfWriter(PdfWriter):
+    """
+    PdfWriter that adds its pages to the end of an existing PDF as an incremental update. Nothing of the existing
+    file is rewritten: a new page tree root holds the previous one followed by the new pages, and only the catalog
+    and a few small objects are updated, so the time it takes depends on the new pages alone
+    """
+    def _start(self):
+        f = open(self.filename, 'r+b')
+        try:
+            self.existing = _ExistingPdf(f)
+        except ValueError:
+            f.close()
+            raise
+        self.original_size = len(self.existing.data)
+        self.pdf = PdfParser.PdfParser()
+        self.pdf.f = f
+        self.pdf.should_close_file = True
+        f.seek(self.original_size)
+        if self.existing.data[-1:] not in (b'\n', b'\r'):
+            f.write(b'\n')
+        self._next_id = self.existing.size
+        self.pages_ref = self._next_ref()
+
+    def _abort(self):
+        # leave the existing document as it was
+        self.existing.close()
+        self.pdf.f.truncate(self.original_size)
+        self.pdf.close()
+
+    def close(self):
+        """
+        write the updated page tree, catalog and document information followed by a cross-reference section
+        in the same form as the previous one and close the file
+        :return:
+        """
+        try:
+            self.__write_update()
+        except BaseException:
+            self._abort()
+            raise
+        self.existing.close()
+        self.pdf.f.flush()
+        self.pdf.close()
+
+    def __write_update(self):
+        existing = self.existing
+        catalog = existing.read(existing.root_ref)
+        old_pages_ref = catalog[b'Pages']
+        old_pages = existing.read(old_pages_ref)
+        # as a child of the new root the previous pages keep inherited attributes like their rotation to themselves
+        old_pages[b'Parent'] = self.pages_ref
+        self.pdf.write_obj(old_pages_ref, old_pages)
+        self._write_obj(self.pages_ref,
+                        Type=PdfParser.PdfName('Pages'),
+                        Count=old_pages.get(b'Count', 0) + len(self.pages),
+                        Kids=[old_pages_ref] + self.pages)
+        catalog[b'Pages'] = self.pages_ref
+        self.pdf.write_obj(existing.root_ref, catalog)
+
+        info_ref = existing.trailer.get(b'Info')
+        if info_ref is None:
+            info, info_ref = self.info, self._next_ref()
+        else:
+            info = existing.read(info_ref)
+        info[b'ModDate'] = time.gmtime()
+        self.pdf.write_obj(info_ref, info)
+
+        f = self.pdf.f
+        trailer = dict(Root=existing.root_ref, Info=info_ref, Prev=existing.xref_offset)
+        if b'ID' in existing.trailer:
+            trailer['ID'] = [PdfParser.PdfBinary(bytes(existing.trailer[b'ID'][0])),
+                             PdfParser.PdfBinary(hashlib.md5(f'{self.filename}{time.time()}{f.tell()}'.encode())
+                                                 .digest())]
+        if existing.is_xref_stream:
+            xref_ref = self._next_ref()
+            offsets = dict(self.pdf.xref_table.new_entries)
+            offsets[xref_ref.object_id] = (f.tell(), 0)
+            numbers = sorted(offsets)
+            index = list()
+            for n in numbers:
+                if index and index[-2] + index[-1] == n:
+                    index[-1] += 1
+                else:
+                    index += [n, 1]
+            offset_width = max(4, f.tell().bit_length() // 8 + 1)
+            data = _xref_stream_data([(1, *offsets[n]) for n in numbers], offset_width)
+            start_xref = f.tell()
+            self._write_obj(xref_ref, stream=zlib.compress(data),
+                            Type=PdfParser.PdfName('XRef'),
+                            Size=self._next_id,
+                            Index=index,
+                            W=[1, offset_width, 2],
+                            Filter=PdfParser.PdfName('FlateDecode'),
+                            **trailer)
+        else:
+            start_xref = self.pdf.xref_table.write(f)
+            f.write(b'trailer\n' + bytes(PdfParser.PdfDict(Size=self._next_id, **trailer)))
+        f.write(b'\nstartxref\n%d\n%%%%EOF\n' % start_xref)
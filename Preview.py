@@ -1,10 +1,22 @@
 from PyQt6.QtWidgets import QWidget, QLabel, QLineEdit, QPushButton, QHBoxLayout, QVBoxLayout, QSizePolicy
-from PyQt6.QtGui import QImage, QPixmap, QPainter, QIntValidator
-from PyQt6.QtCore import Qt, pyqtSignal, pyqtSlot
+from PyQt6.QtGui import QImage, QPainter, QPen, QColor, QIntValidator
+from PyQt6.QtCore import Qt, QPointF, QRectF, pyqtSignal, pyqtSlot
+
+from collections import OrderedDict
+import math
 
 from structures import ImageFile
 
 
+TILE_SIZE = 256
+MAX_CACHED_TILES = 256      # ~48 MB of tiles
+ZOOM_STEP = 1.25    # zoom factor of one step of the mouse wheel
+MAX_PIXEL_SIZE = 16     # maximum size of an image pixel on screen
+SHARP_PIXEL_SIZE = 2    # from this size on, pixels are drawn as squares, so the margins can be set precisely
+BACKGROUND_COLOR = QColor(192, 192, 192)
+CROPPED_AREA_COLOR = QColor(0, 0, 0, 128)
+
+
 class PageCounter(QWidget):
     """
     Widget for displaying the current image index out of the total and for switching to a specific image index
@@ -70,60 +82,228 @@ class PageCounter(QWidget):
         self.page_nr_lbl.setFixedWidth(width)
 
 
-class PreviewLabel(QLabel):
+class TilePyramid:
     """
-    Label for displaying a preview of the cropped file
+    Tiles of an image file at several resolutions that are only created once they are drawn. Level 0 is the image
+    at full size and every further level halves it. JPEG files are decoded right at the size of a level, others are
+    reduced from the level below, so the full image is only decoded when it is needed
+    """
+    def __init__(self, file: ImageFile):
+        self.file = file
+        self.width, self.height = file.width, file.height
+        self.levels = dict()    # level -> PIL Image
+        self.tiles = OrderedDict()  # (level, column, row) -> QImage, least recently drawn first
+        # the smallest level still fills a tile
+        self.max_level = max(0, math.ceil(math.log2(max(self.width, self.height, 1) / TILE_SIZE)))
+
+    def level_for(self, scale: float):
+        """
+        :param scale: size on screen of a pixel of the full image
+        :return: the smallest level with at least one pixel per screen pixel
+        """
+        if scale >= 1:
+            return 0
+        return min(self.max_level, math.floor(math.log2(1 / scale)))
+
+    def level_size(self, level: int):
+        return -(-self.width // 2**level), -(-self.height // 2**level)
+
+    def level_image(self, level: int):
+        if level not in self.levels:
+            img = None
+            if level > 0 and level - 1 not in self.levels:
+                with self.file.pil_image() as source:
+                    if source.format == 'JPEG':
+                        source.draft('RGB', self.level_size(level))
+                        img = source.convert('RGB')
+                if img is not None and img.size != self.level_size(level):
+                    from PIL import Image   # loaded with the first files, see ImageFile
+                    img = img.resize(self.level_size(level), Image.Resampling.BOX)
+            if img is None and level > 0:
+                img = self.level_image(level - 1).reduce(2)
+            elif img is None:
+                with self.file.pil_image() as source:
+                    img = source.convert('RGB')
+            self.levels[level] = img
+        return self.levels[level]
+
+    def tile(self, level: int, column: int, row: int):
+        """
+        :return: QImage of the tile in the given column and row of a level
+        """
+        key = (level, column, row)
+        tile = self.tiles.get(key)
+        if tile is not None:
+            self.tiles.move_to_end(key)
+            return tile
+        img = self.level_image(level)
+        part = img.crop((column * TILE_SIZE, row * TILE_SIZE,
+                         min(img.width, (column + 1) * TILE_SIZE), min(img.height, (row + 1) * TILE_SIZE)))
+        # rows of a QImage are aligned to 4 bytes, so their length has to be given; the copy owns its pixels
+        tile = QImage(part.tobytes('raw', 'RGB'), part.width, part.height, part.width * 3,
+                      QImage.Format.Format_RGB888).copy()
+        self.tiles[key] = tile
+        while len(self.tiles) > MAX_CACHED_TILES:
+            self.tiles.popitem(last=False)
+        return tile
+
+
+class PreviewLabel(QWidget):
+    """
+    Widget for displaying a preview of the file with its crop margins. The mouse wheel zooms in on the position of
+    the cursor, dragging moves the view and a double click shows the whole image again. Only the tiles of the
+    visible area are drawn, the crop margins are painted over them
     """
     def __init__(self, file: ImageFile = None):
         super(PreviewLabel, self).__init__()
         self.file = file
-        self.img = QImage()
-        self.setStyleSheet('background-color: rgb(192, 192, 192)')
+        self.pyramid = None
+        self.zoom = 1.0     # magnification compared to fitting the whole image into the widget
+        self.center = QPointF()     # position in the image that is shown in the middle of the widget
+        self.drag_start = None      # position of the cursor and the center when dragging started
+        self.generation = 0     # increased whenever another image or other crop margins are shown
         self.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
-        self.setAlignment(Qt.AlignmentFlag.AlignCenter)
         self.setMinimumSize(375, 500)
 
-    def resizeEvent(self, a0) -> None:
-        super(PreviewLabel, self).resizeEvent(a0)
-        self.update_pixmap()
+    def scale(self):
+        """
+        :return: size on screen of a pixel of the image
+        """
+        if self.pyramid is None or not self.pyramid.width or not self.pyramid.height:
+            return 1.0
+        return min(self.width() / self.pyramid.width, self.height() / self.pyramid.height) * self.zoom
 
-    def update_pixmap(self):
-        pixmap = QPixmap.fromImage(self.img)
-        if not pixmap.isNull():
-            pixmap = pixmap.scaled(self.size(),
-                                   Qt.AspectRatioMode.KeepAspectRatio,
-                                   Qt.TransformationMode.SmoothTransformation)
-            self.setPixmap(pixmap)
+    def to_image(self, position: QPointF):
+        return self.center + (position - QPointF(self.width() / 2, self.height() / 2)) / self.scale()
 
-    def draw_crop(self):
+    def __limit_center(self):
         """
-        draw the area outside the crop margins as grayed out and add some lines to emphasize where
-        exactly those margins lie
+        keep the image in view; when it is smaller than the widget in a direction, it is centered in that direction
         :return:
         """
-        if self.file:
-            h = self.file.height
-            w = self.file.width
-
-            grayscale = self.file.pil_image().convert('L')
-            grayscale = grayscale.point(lambda p: p * 0.5)  # darken grayscale
-            cropped_img = self.file.crop()
-            img = grayscale.convert('RGB')
-            img.paste(cropped_img, (self.file.left_margin, self.file.top_margin))
-            self.img = QImage(img.tobytes('raw', 'RGB'), w, h, QImage.Format.Format_RGB888)
+        scale = self.scale()
+        coordinates = list()
+        for value, size, view in ((self.center.x(), self.pyramid.width, self.width() / scale),
+                                  (self.center.y(), self.pyramid.height, self.height() / scale)):
+            coordinates.append(size / 2 if size <= view else min(max(value, view / 2), size - view / 2))
+        self.center = QPointF(*coordinates)
+
+    def paintEvent(self, a0) -> None:
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), BACKGROUND_COLOR)
+        if self.pyramid is None:
+            self.__draw_missing(painter)
+            return
+        scale = self.scale()
+        painter.translate(self.width() / 2, self.height() / 2)
+        painter.scale(scale, scale)
+        painter.translate(-self.center)
+
+        # tiles of the visible area at the level that matches the zoom; magnified pixels are shown sharp
+        level = self.pyramid.level_for(scale)
+        tile_extent = TILE_SIZE * 2**level
+        top_left = self.to_image(QPointF(0, 0))
+        bottom_right = self.to_image(QPointF(self.width(), self.height()))
+        columns, rows = (-(-size // TILE_SIZE) for size in self.pyramid.level_size(level))
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform, scale * 2**level < SHARP_PIXEL_SIZE)
+        painter.save()
+        painter.scale(2**level, 2**level)
+        try:
+            for row in range(max(0, int(top_left.y() // tile_extent)),
+                             min(rows, int(bottom_right.y() // tile_extent) + 1)):
+                for column in range(max(0, int(top_left.x() // tile_extent)),
+                                    min(columns, int(bottom_right.x() // tile_extent) + 1)):
+                    painter.drawImage(QPointF(column * TILE_SIZE, row * TILE_SIZE),
+                                      self.pyramid.tile(level, column, row))
+        except OSError:     # the file was removed or damaged after it was verified
+            self.file.missing = True
+            self.pyramid = None
+        finally:
+            painter.restore()
+        if self.pyramid is None:
+            painter.resetTransform()
+            painter.fillRect(self.rect(), BACKGROUND_COLOR)
+            self.__draw_missing(painter)
+            return
+
+        # darken the area outside the crop margins and emphasize where exactly those margins lie
+        w, h = self.pyramid.width, self.pyramid.height
+        left, top, right, bottom = self.file.crop_box()
+        for rect in (QRectF(0, 0, w, top), QRectF(0, bottom, w, h - bottom),
+                     QRectF(0, top, left, bottom - top), QRectF(right, top, w - right, bottom - top)):
+            if rect.isValid():
+                painter.fillRect(rect, CROPPED_AREA_COLOR)
+        painter.setPen(QPen(Qt.GlobalColor.cyan, 0))
+        painter.drawLine(QPointF(self.file.left_margin, 0), QPointF(self.file.left_margin, h))
+        painter.drawLine(QPointF(self.file.right_margin, 0), QPointF(self.file.right_margin, h))
+        painter.drawLine(QPointF(0, self.file.top_margin), QPointF(w, self.file.top_margin))
+        painter.drawLine(QPointF(0, self.file.bottom_margin), QPointF(w, self.file.bottom_margin))
+        painter.end()
+
+    def __draw_missing(self, painter: QPainter):
+        """
+        placeholder for a file that can't be read, e.g. because it was moved since the session was saved
+        :param painter: QPainter of the widget
+        :return:
+        """
+        if self.file is not None and self.file.missing:
+            painter.drawText(QRectF(self.rect()), Qt.AlignmentFlag.AlignCenter | Qt.TextFlag.TextWordWrap,
+                             f'{self.file.absolute_path}\ncan\'t be read')
 
-            painter = QPainter(self.img)
-            painter.setPen(Qt.GlobalColor.cyan)
-            painter.drawLine(self.file.left_margin, 0, self.file.left_margin, h)
-            painter.drawLine(self.file.right_margin, 0, self.file.right_margin, h)
-            painter.drawLine(0, self.file.top_margin, w, self.file.top_margin)
-            painter.drawLine(0, self.file.bottom_margin, w, self.file.bottom_margin)
-            painter.end()
+    def resizeEvent(self, a0) -> None:
+        super(PreviewLabel, self).resizeEvent(a0)
+        if self.pyramid is not None:
+            self.__limit_center()
+
+    def wheelEvent(self, a0) -> None:
+        if self.pyramid is None:
+            return
+        position = a0.position()
+        anchor = self.to_image(position)
+        max_zoom = max(1.0, MAX_PIXEL_SIZE / (self.scale() / self.zoom))
+        self.zoom = min(max_zoom, max(1.0, self.zoom * ZOOM_STEP ** (a0.angleDelta().y() / 120)))
+        # the pixel under the cursor stays where it is
+        self.center = anchor - (position - QPointF(self.width() / 2, self.height() / 2)) / self.scale()
+        self.__limit_center()
+        self.update()
+
+    def mousePressEvent(self, a0) -> None:
+        if a0.button() == Qt.MouseButton.LeftButton and self.zoom > 1:
+            self.drag_start = (a0.position(), self.center)
+            self.setCursor(Qt.CursorShape.ClosedHandCursor)
+
+    def mouseMoveEvent(self, a0) -> None:
+        if self.drag_start is not None:
+            position, center = self.drag_start
+            self.center = center - (a0.position() - position) / self.scale()
+            self.__limit_center()
+            self.update()
+
+    def mouseReleaseEvent(self, a0) -> None:
+        self.drag_start = None
+        self.unsetCursor()
+
+    def mouseDoubleClickEvent(self, a0) -> None:
+        if self.pyramid is not None:
+            self.zoom = 1.0
+            self.__limit_center()
+            self.update()
 
-            self.update_pixmap()
+    def draw_crop(self):
+        """
+        show the current crop margins, they are painted over the image with every frame
+        :return:
+        """
+        self.generation += 1
+        self.update()
 
     @pyqtSlot(ImageFile)
     def set_image(self, file: ImageFile):
+        if file is not self.file or self.pyramid is None:
+            file.verify()   # the size of the pyramid has to match the file
+            self.pyramid = TilePyramid(file) if not file.missing else None
+            self.zoom = 1.0
+            self.center = QPointF(file.width / 2, file.height / 2)
         self.file = file
         self.draw_crop()
 
@@ -1,13 +1,356 @@
 from PyQt6.QtWidgets import (QWidget, QLabel, QPushButton, QLineEdit, QCheckBox, QSlider, QSpacerItem,
-                             QProgressBar, QVBoxLayout, QHBoxLayout, QGridLayout,
+                             QProgressBar, QTabBar, QComboBox, QHBoxLayout, QGridLayout,
                              QFileDialog, QDialog, QSizePolicy)
 from PyQt6.QtGui import QIntValidator
-from PyQt6.QtCore import Qt, QObject, QRunnable, QThreadPool, pyqtSignal, pyqtSlot
-
-from PIL import Image
+from PyQt6.QtCore import Qt, QObject, QRunnable, QThread, QThreadPool, QTimer, pyqtSignal, pyqtSlot
+
+from PIL import Image, ImageChops, ImageFilter, ImageStat
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+import threading
+import io
 import os.path
+import time
+
+from structures import ImageFile, SaveOptions, ColorModes
+from PdfWriter import (PdfWriter, LinearizedPdfWriter, AppendingPdfWriter, EncodedImage, ImagePlacement,
+                       encode_image, encode_image_lossless, encode_image_bilevel, encode_file)
+
+# largest share of an image's area that is embedded but clipped away when cropping inside the PDF;
+# if more of the image is cut off, the crop is applied to the pixels so the file doesn't bloat.
+# An embedded JPEG file is still kept if re-encoding its cropped area saves less than this share of its size
+MAX_CLIPPED_AREA = 0.3
+# sources that are compressed lossy already; they are re-encoded as JPEG even when cropping inside the PDF,
+# a lossless encoding of their pixels is many times larger than the file
+LOSSY_SUFFIXES = ('jpg', 'jpeg')
+# memory the export jobs may use for keeping decoded source images around to share them
+MAX_DECODED_BYTES = 512 * 1024 * 1024
+# memory for pages encoded in the background ahead of an export
+MAX_PREENCODED_BYTES = 256 * 1024 * 1024
+# time without edits before pages are encoded in the background
+PREENCODE_DELAY_MS = 2000
+# exports running at the same time; further jobs are queued so the editor stays responsive
+MAX_CONCURRENT_EXPORTS = max(1, min(2, QThread.idealThreadCount() // 2))
+# number of pages encoded to estimate the size and duration of an export
+ESTIMATE_SAMPLE_SIZE = 6
+# time without further changes in the SaveDialog before a new estimate is started
+ESTIMATE_DELAY_MS = 300
+# bytes of PDF structure per page and per file, besides the image data
+PDF_PAGE_OVERHEAD = 500
+PDF_FILE_OVERHEAD = 1000
+# a pixel turns black if it is this much darker than the mean of its surroundings or darker than the floor
+THRESHOLD_OFFSET = 12
+THRESHOLD_FLOOR = 80
+# Pillow releases the GIL while filtering, so pages are thresholded in horizontal bands on several threads
+THRESHOLD_THREADS = max(1, QThread.idealThreadCount())
+threshold_executor = ThreadPoolExecutor(max_workers=THRESHOLD_THREADS)
+# JPEG quality of exports without a target size, Pillow's default
+JPEG_QUALITY = 75
+# JPEG qualities and image scales tried for every page when the PDF has to fit a target size, best first
+QUALITY_LADDER = (90, 75, 60, 45, 30)
+SCALE_LADDER = (1.0, 0.7, 0.5)
+# pages whose ladders are measured at the same time
+LADDER_THREADS = max(1, QThread.idealThreadCount())
+# pages decoded and encoded at the same time during an export, ahead of the one being written
+EXPORT_THREADS = max(1, QThread.idealThreadCount())
+# the error of a rung is measured on bands of rows of this height, one band every ERROR_BAND_SPACING rows
+ERROR_BAND_HEIGHT = 32
+ERROR_BAND_SPACING = 256
+# height of the pages a long strip is cut into relative to its width, the same as A4 portrait
+STRIP_PAGE_RATIO = 2 ** 0.5
+# share at the bottom of a strip page in which the cut may move up to the row with the least content
+STRIP_GAP_SEARCH = 0.25
+
+
+def format_size(size: float):
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1000:
+            return f'{size:.3g} {unit}'
+        size /= 1000
+    return f'{size:.3g} GB'
+
+
+def format_duration(seconds: float):
+    if seconds < 60:
+        return f'{max(1, round(seconds))} s'
+    minutes, seconds = divmod(round(seconds), 60)
+    return f'{minutes} min {seconds} s'
+
+
+def appended_size(options: SaveOptions):
+    """
+    size of the existing PDF the pages are appended to, it counts towards the size limit
+    :param options: SaveOptions of the PDF
+    :return: size in bytes, 0 if a new file is written
+    """
+    if options.append and os.path.isfile(options.save_path):
+        return os.path.getsize(options.save_path)
+    return 0
+
+
+def _threshold_band(gray: Image.Image, top: int, bottom: int, radius: int):
+    # the band is extended by the blur radius, so the local means at its edges are the same as for the whole page
+    band_top = max(0, top - radius)
+    band = gray.crop((0, band_top, gray.width, min(gray.height, bottom + radius)))
+    mean = band.filter(ImageFilter.BoxBlur(radius))
+    darker = ImageChops.subtract(mean, band)
+    light = darker.point(lambda v: 255 if v <= THRESHOLD_OFFSET else 0, '1')
+    above_floor = band.point(lambda v: 255 if v >= THRESHOLD_FLOOR else 0, '1')
+    white = ImageChops.logical_and(light, above_floor)
+    return white.crop((0, top - band_top, white.width, bottom - band_top))
+
+
+def threshold_adaptive(gray: Image.Image):
+    """
+    convert a grayscale image to black and white by comparing each pixel to the mean of its surroundings,
+    which keeps text readable on unevenly lit or yellowed scans
+    :param gray: image in mode 'L'
+    :return: image in mode '1'
+    """
+    radius = max(4, max(gray.size) // 100)
+    bands = max(1, min(THRESHOLD_THREADS, gray.height // (8 * radius)))
+    bounds = [gray.height * i // bands for i in range(bands + 1)]
+    results = threshold_executor.map(lambda i: _threshold_band(gray, bounds[i], bounds[i + 1], radius), range(bands))
+    result = Image.new('1', gray.size)
+    for top, band in zip(bounds, results):
+        result.paste(band, (0, top))
+    return result
+
+
+def comparable(img: Image.Image) -> Image.Image:
+    """
+    :param img: image of any mode
+    :return: the image in the mode its pixels are encoded in like encode_image does, black and white as grayscale
+    """
+    if img.mode == 'L' or img.mode == 'RGB':
+        return img
+    return img.convert('L' if img.mode == '1' else 'RGB')
+
+
+def sampled_error(reference: Image.Image, img: Image.Image) -> float:
+    """
+    sum of the squared differences between an image and its reference, measured on evenly spaced bands of rows
+    and extrapolated to the whole image; both are compared in the mode they are encoded in, see comparable
+    :param reference: image at full quality
+    :param img: image of the same content, it is scaled to the size of the reference for the comparison
+    :return: estimated sum of squared differences per band of the image
+    """
+    reference = comparable(reference)
+    img = comparable(img)
+    ratio = img.height / reference.height
+    error = 0
+    sampled_rows = 0
+    for top in range(ERROR_BAND_SPACING // 2, reference.height, ERROR_BAND_SPACING):
+        bottom = min(top + ERROR_BAND_HEIGHT, reference.height)
+        if img.size == reference.size:
+            band = img.crop((0, top, img.width, bottom))
+        else:
+            band = img.resize((reference.width, bottom - top), Image.Resampling.BILINEAR,
+                              box=(0, top * ratio, img.width, bottom * ratio))
+        difference = ImageChops.difference(reference.crop((0, top, reference.width, bottom)), band)
+        error += sum(ImageStat.Stat(difference).sum2)
+        sampled_rows += bottom - top
+    if not sampled_rows:    # image lower than the first band
+        error = sum(ImageStat.Stat(ImageChops.difference(reference, img.resize(reference.size))).sum2)
+        sampled_rows = reference.height
+    return error * reference.height / sampled_rows / len(reference.getbands())
+
+
+def find_gap(region: Image.Image) -> int:
+    """
+    find the row with the least content in an image, e.g. the space between two panels or lines of text;
+    of equally empty rows the lowest one is taken
+    :param region: image to search, at least three rows high
+    :return: index of the row
+    """
+    edges = region.convert('L').filter(ImageFilter.FIND_EDGES).convert('F')
+    energies = list(edges.resize((1, edges.height), Image.Resampling.BOX).getdata())   # mean edge strength per row
+    # the filter leaves the outermost rows unchanged, they don't tell anything about the content
+    return min(range(edges.height - 2, 0, -1), key=lambda y: energies[y])
 
-from structures import ImageFile
+
+def allocate_rungs(stats: list[list[tuple[int, float]]], budget: float, weights: list[int] = None) -> list[int]:
+    """
+    choose one rung for every page so that the pages fit into the budget with the least total error.
+    Every page takes the rung that minimizes error + λ * size, λ is searched so that the sum of the sizes just fits;
+    the budget left over then upgrades single pages where that buys the most quality per byte
+    :param stats: for every page the (size in bytes, error) of each of its rungs
+    :param budget: bytes available for the images
+    :param weights: number of pages each entry stands for, 1 for all if omitted
+    :return: index of the chosen rung for every page
+    """
+    weights = weights if weights is not None else [1] * len(stats)
+
+    def choose(lagrange: float):
+        return [min(range(len(rungs)), key=lambda j: (rungs[j][1] + lagrange * rungs[j][0], rungs[j][0]))
+                for rungs in stats]
+
+    def total(choice: list[int]):
+        return sum(w * rungs[j][0] for w, rungs, j in zip(weights, stats, choice))
+
+    best = choose(0)
+    if total(best) <= budget:
+        return best
+    smallest = [min(range(len(rungs)), key=lambda j: rungs[j][0]) for rungs in stats]
+    if total(smallest) > budget:
+        return smallest     # the target can't be reached, come as close as possible
+
+    low, high = 0, 1
+    while total(choose(high)) > budget:
+        low, high = high, high * 2
+    for _ in range(40):
+        middle = (low + high) / 2
+        if total(choose(middle)) > budget:
+            low = middle
+        else:
+            high = middle
+    choice = choose(high)
+
+    spare = budget - total(choice)
+    upgrades = list()
+    for i, (w, rungs, j) in enumerate(zip(weights, stats, choice)):
+        for k, (size, error) in enumerate(rungs):
+            if error < rungs[j][1] and size > rungs[j][0]:
+                upgrades.append(((rungs[j][1] - error) / (size - rungs[j][0]), i, k))
+    for _, i, k in sorted(upgrades, reverse=True):
+        j = choice[i]
+        added = weights[i] * (stats[i][k][0] - stats[i][j][0])
+        if stats[i][k][1] < stats[i][j][1] and added <= spare:
+            choice[i] = k
+            spare -= added
+    return choice
+
+
+class DecodeCache:
+    """
+    Thread-safe cache of fully decoded source images, limited by the memory their pixels take up.
+    If several threads need the same image at once, it is only decoded by the first one while the others wait.
+    The cached images are shared and must not be modified
+    """
+    def __init__(self, max_bytes: int = MAX_DECODED_BYTES):
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self.images = OrderedDict()     # key -> decoded image, least recently used first
+        self.loading = dict()           # key -> threading.Event of images that are currently being decoded
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def decode(file: ImageFile):
+        """
+        open and fully decode the image of a file
+        :param file: ImageFile to decode
+        :return: PIL Image
+        """
+        with file.pil_image() as img:
+            img.load()
+        return img
+
+    @staticmethod
+    def image_bytes(img: Image.Image):
+        return img.width * img.height * len(img.getbands())
+
+    def get(self, file: ImageFile):
+        """
+        the decoded image of a file, either from the cache or freshly decoded
+        :param file: ImageFile to decode
+        :return: PIL Image
+        """
+        file.verify()
+        key = (file.absolute_path, file.frame, file.file_size, file.last_modified.toMSecsSinceEpoch())
+        while True:
+            with self.lock:
+                img = self.images.get(key)
+                if img is not None:
+                    self.images.move_to_end(key)
+                    return img
+                loading = self.loading.get(key)
+                if loading is None:
+                    loading = self.loading[key] = threading.Event()
+                    break
+            loading.wait()  # decoded by another thread, look it up again
+
+        try:
+            img = self.decode(file)
+            with self.lock:
+                size = self.image_bytes(img)
+                if size <= self.max_bytes:
+                    self.images[key] = img
+                    self.used_bytes += size
+                    while self.used_bytes > self.max_bytes:
+                        self.used_bytes -= self.image_bytes(self.images.popitem(last=False)[1])
+            return img
+        finally:
+            with self.lock:
+                del self.loading[key]
+            loading.set()
+
+    def clear(self):
+        with self.lock:
+            self.images.clear()
+            self.used_bytes = 0
+
+
+class EncodingCache:
+    """
+    Thread-safe store of images encoded ahead of an export, limited by the size of their streams.
+    Entries are looked up by the state of the file and the encoder settings of a profile, so they are found again
+    after reordering or changing the layout but never used once the margins or the settings have changed
+    """
+    def __init__(self, max_bytes: int = MAX_PREENCODED_BYTES):
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self.images = dict()    # (file key, profile key) -> EncodedImage
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def file_key(file: ImageFile):
+        return file.absolute_path, file.frame, file.file_size, file.last_modified.toMSecsSinceEpoch(), file.crop_box()
+
+    @staticmethod
+    def profile_key(options: SaveOptions):
+        # path, resolution and linearization only matter when the pages are written
+        return options.color_mode, options.img_scale, options.optimize, options.compression_level, options.crop_in_pdf
+
+    def get(self, file: ImageFile, options: SaveOptions) -> EncodedImage | None:
+        with self.lock:
+            return self.images.get((self.file_key(file), self.profile_key(options)))
+
+    def put(self, file: ImageFile, options: SaveOptions, image: EncodedImage):
+        """
+        store an encoded image unless the cache is full
+        :param file: ImageFile the image was encoded from
+        :param options: SaveOptions it was encoded for
+        :param image: EncodedImage
+        :return: whether the image is stored
+        """
+        key = (self.file_key(file), self.profile_key(options))
+        with self.lock:
+            if key in self.images:
+                return True
+            if self.used_bytes + len(image.stream) > self.max_bytes:
+                return False
+            self.images[key] = image
+            self.used_bytes += len(image.stream)
+            return True
+
+    def retain(self, files: list[ImageFile], profiles: list[SaveOptions]):
+        """
+        drop every image that doesn't belong to the current state of the files and profiles
+        :param files: loaded files
+        :param profiles: profiles of the next export
+        :return:
+        """
+        file_keys = {self.file_key(f) for f in files}
+        profile_keys = {self.profile_key(o) for o in profiles}
+        with self.lock:
+            for key in [k for k in self.images if k[0] not in file_keys or k[1] not in profile_keys]:
+                self.used_bytes -= len(self.images.pop(key).stream)
+
+    def clear(self):
+        with self.lock:
+            self.images.clear()
+            self.used_bytes = 0
 
 
 class SavingRunnable(QRunnable):
@@ -15,144 +358,740 @@ class SavingRunnable(QRunnable):
     QRunnable instance to prepare the PDF pages and save the file without blocking the GUI-thread
     """
     class SavingSignal(QObject):
+        started = pyqtSignal()
         finished = pyqtSignal()
+        failed = pyqtSignal(str)    # emits error message
         progress = pyqtSignal(int)
 
-    def __init__(self, files, filename, separate_cover, right_to_left, double_pages, to_grayscale=False, optimize=False, compress_lvl=0, res=300, img_scale=1.0):
+    def __init__(self, files, profiles: list[SaveOptions], separate_cover, right_to_left, double_pages,
+                 decode_cache: DecodeCache = None, long_strip: bool = False, cut_at_gaps: bool = False,
+                 encoding_cache: EncodingCache = None):
         super(SavingRunnable, self).__init__()
-        self.page_list = list()
         self.files = files
-        self.filename = filename
+        self.profiles = profiles    # one PDF is created for each of the options
         self.right_to_left = right_to_left
         self.separate_cover = separate_cover
         self.double_pages = double_pages
-        self.to_grayscale = to_grayscale
-        self.optimize = optimize
-        self.compression_level = compress_lvl
-        self.resolution = res
-        self.img_scale = img_scale
+        self.long_strip = long_strip    # join all images vertically and cut the strip into pages
+        self.cut_at_gaps = cut_at_gaps
+        self.decode_cache = decode_cache
+        self.encoding_cache = encoding_cache    # pages encoded in the background before the export
+        # file or strip page index -> (quality, scale) chosen for the profiles with a target size
+        self.rungs = [dict() for _ in profiles]
+        self.progress_offset = 0
         self.signal = SavingRunnable.SavingSignal()
 
+    def progress_steps(self):
+        # the ladders of all files are measured before the pages are written when aiming for a target size
+        return len(self.files) * (2 if any(o.target_size for o in self.profiles) else 1)
+
+    def decode(self, file: ImageFile):
+        if self.decode_cache is not None:
+            return self.decode_cache.get(file)
+        return DecodeCache.decode(file)
+
+    def prepare_image(self, file: ImageFile, clip: bool, scale: float, color_mode: ColorModes, images: dict):
+        """
+        crop, scale and convert the decoded image of a file; every intermediate result is kept in images,
+        so profiles with the same settings for a file share the work
+        :param file: ImageFile to prepare
+        :param clip: whether the crop is left to the PDF instead of being applied to the pixels
+        :param scale: image scale
+        :param color_mode: ColorMode to convert the image to
+        :param images: prepared images of this file by their settings
+        :return: PIL Image
+        """
+        key = (clip, scale, color_mode)
+        if key not in images:
+            if color_mode == ColorModes.BLACK_WHITE:
+                img = threshold_adaptive(self.prepare_image(file, clip, scale, ColorModes.GRAYSCALE, images))
+            elif color_mode == ColorModes.DITHERED:
+                img = self.prepare_image(file, clip, scale, ColorModes.GRAYSCALE, images).convert('1')
+            elif color_mode == ColorModes.GRAYSCALE:
+                img = self.prepare_image(file, clip, scale, ColorModes.COLOR, images).convert('L')
+            elif scale != 1.0:
+                img = self.prepare_image(file, clip, 1.0, ColorModes.COLOR, images)
+                img = img.resize((int(img.width*scale), int(img.height*scale)))
+            elif clip:
+                # the decoded image may be shared with other jobs, only the lossless encoder gets to see it unchanged
+                img = self.decode(file)
+            else:
+                img = self.prepare_image(file, True, 1.0, ColorModes.COLOR, images).crop(file.crop_box())
+            images[key] = img
+        return images[key]
+
     @staticmethod
-    def create_double_page(img_left: Image = None, img_right: Image = None, to_grayscale: bool = False):
+    def encoding_of(options: SaveOptions, lossy_source: bool = False):
+        """
+        :param options: SaveOptions of a profile
+        :param lossy_source: whether the image comes from a lossy compressed file
+        :return: how the images of the profile are compressed, 'fax', 'lossless' or 'jpeg'
+        """
+        if options.color_mode == ColorModes.BLACK_WHITE:
+            return 'fax'
+        # fax compression handles the noise of dithering badly, zlib stays several times smaller
+        if options.color_mode == ColorModes.DITHERED or (options.crop_in_pdf and not options.target_size
+                                                         and not lossy_source):
+            return 'lossless'
+        return 'jpeg'
+
+    @classmethod
+    def ladder(cls, options: SaveOptions):
+        """
+        :param options: SaveOptions of a profile with a target size
+        :return: list of the (quality, scale) tried for every page, the quality is None for lossless encodings
+        """
+        qualities = QUALITY_LADDER if cls.encoding_of(options) == 'jpeg' else (None,)
+        return [(quality, scale) for scale in SCALE_LADDER for quality in qualities]
+
+    @classmethod
+    def encode_prepared(cls, img: Image.Image, options: SaveOptions, quality: int = None,
+                        lossy_source: bool = False) -> EncodedImage:
+        encoding = cls.encoding_of(options, lossy_source)
+        if encoding == 'fax':
+            return encode_image_bilevel(img)
+        if encoding == 'lossless':
+            return encode_image_lossless(img, options.compression_level)
+        return encode_image(img, options.optimize, quality or JPEG_QUALITY)
+
+    def measure_ladder(self, file: ImageFile | int, images: dict = None) -> list[list[tuple[int, float]] | None]:
+        """
+        encode a file at every rung of the ladder of each profile with a target size and measure the size of the
+        results and their error compared to the image at the best quality
+        :param file: ImageFile to measure, or index of a strip page
+        :param images: prepared images to start from, see prepare_image; holds the image of a strip page
+        :return: for every profile a list with the (size in bytes, error) of each rung, None without target size
+        """
+        images = images if images is not None else dict()
+        stats = list()
+        for options in self.profiles:
+            if not options.target_size:
+                stats.append(None)
+                continue
+            # converted once here, so every rung is compared against the same image
+            reference = comparable(self.prepare_image(file, False, options.img_scale, options.color_mode, images))
+            rung_stats = list()
+            for quality, scale in self.ladder(options):
+                img = self.prepare_image(file, False, options.img_scale * scale, options.color_mode, images)
+                encoded = self.encode_prepared(img, options, quality)
+                if quality is not None:
+                    with Image.open(io.BytesIO(encoded.stream)) as decoded:
+                        decoded.load()
+                        error = sampled_error(reference, decoded)
+                else:
+                    error = sampled_error(reference, img)
+                rung_stats.append((len(encoded.stream), error))
+            stats.append(rung_stats)
+        return stats
+
+    def allocate(self):
+        """
+        measure the ladders of all files or strip pages in parallel and choose the rung of every page for the
+        profiles with a target size, so that their PDFs fit with the best quality.
+        Only a few pages more than there are threads are prepared at a time
+        :return:
+        """
+        targets = [i for i, o in enumerate(self.profiles) if o.target_size]
+        if not targets:
+            return
+        if self.long_strip:
+            units = ((i, {(False, 1.0, ColorModes.COLOR): page}) for i, page in enumerate(self.strip_pages()))
+        else:
+            units = ((f, dict()) for f in self.files)
+
+        keys = list()
+        stats = list()
+        with ThreadPoolExecutor(max_workers=LADDER_THREADS) as executor:
+            pending = deque()
+            for key, images in units:
+                keys.append(key)
+                pending.append(executor.submit(self.measure_ladder, key, images))
+                while len(pending) > LADDER_THREADS or (pending and pending[0].done()):
+                    stats.append(pending.popleft().result())
+                    if not self.long_strip:     # strip_pages reports the files it has joined
+                        self.signal.progress.emit(len(stats) - 1)
+            stats.extend(future.result() for future in pending)
+        self.progress_offset = len(self.files)
+
+        for index in targets:
+            options = self.profiles[index]
+            budget = options.target_size - appended_size(options) - PDF_FILE_OVERHEAD - PDF_PAGE_OVERHEAD * len(keys)
+            choice = allocate_rungs([s[index] for s in stats], budget)
+            ladder = self.ladder(options)
+            self.rungs[index] = {key: ladder[j] for key, j in zip(keys, choice)}
+
+    def encode_file(self, file: ImageFile) -> list[EncodedImage]:
+        """
+        crop, scale and convert an image file according to every profile and encode it for the PDFs;
+        the file is decoded and cropped only once for all of them.
+        Unchanged JPEG files are embedded as they are without being decoded.
+        When cropping inside the PDF, the whole image is embedded and only its crop box is shown; JPEG files as they
+        are, other images losslessly. If much of the image is cut off, the cropped area is encoded instead,
+        for JPEG files only when that is actually smaller.
+        Profiles with a target size use the quality and scale chosen for the file by allocate,
+        the others take images that were encoded in the background if there are any
+        :param file: ImageFile to encode
+        :return: one EncodedImage per profile
+        """
+        cached = [self.encoding_cache.get(file, o) if self.encoding_cache is not None and not o.target_size else None
+                  for o in self.profiles]
+        if all(image is not None for image in cached):
+            return cached
+        clips = [o.crop_in_pdf and not o.target_size and file.cropped_area_ratio() <= MAX_CLIPPED_AREA
+                 for o in self.profiles]
+        unchanged = [image is None and o.img_scale == 1.0 and o.color_mode == ColorModes.COLOR and not o.target_size
+                     and (o.crop_in_pdf or not file.is_cropped()) for o, image in zip(self.profiles, cached)]
+        passthrough = encode_file(file.absolute_path) if any(unchanged) else None
+        if passthrough is None:
+            unchanged = [False] * len(self.profiles)
+        else:
+            passthrough.crop_box = file.crop_box()
+        # profiles that clip too much of the JPEG file compare it with its cropped area re-encoded
+        contested = [keep and o.crop_in_pdf and not clip for o, clip, keep in zip(self.profiles, clips, unchanged)]
+        encoded = self.encode_images(file, dict(), clips,
+                                     [image if image is not None else passthrough if keep and not contest else None
+                                      for image, keep, contest in zip(cached, unchanged, contested)],
+                                     file.suffix in LOSSY_SUFFIXES)
+        for i, contest in enumerate(contested):
+            if contest and len(passthrough.stream) * (1 - MAX_CLIPPED_AREA) <= len(encoded[i].stream):
+                encoded[i] = passthrough
+        return encoded
+
+    def encode_images(self, file: ImageFile | int, images: dict, clips: list[bool] = None,
+                      passthroughs: list[EncodedImage | None] = None, lossy_source: bool = False) -> list[EncodedImage]:
+        """
+        encode the image of a file or strip page for every profile
+        :param file: ImageFile to encode, or index of a strip page
+        :param images: prepared images to start from, see prepare_image; holds the image of a strip page
+        :param clips: for every profile whether the crop is left to the PDF, never if omitted
+        :param passthroughs: for every profile an EncodedImage to embed as it is or None, none if omitted
+        :param lossy_source: whether the image comes from a lossy compressed file, see encoding_of
+        :return: one EncodedImage per profile
+        """
+        clips = clips if clips is not None else [False] * len(self.profiles)
+        passthroughs = passthroughs if passthroughs is not None else [None] * len(self.profiles)
+        encodings = dict()  # encoder settings -> EncodedImage, for profiles that only differ in e.g. resolution
+        encoded = list()
+        for options, clip, passthrough, rungs in zip(self.profiles, clips, passthroughs, self.rungs):
+            if passthrough is not None:
+                encoded.append(passthrough)
+                continue
+            quality, scale = rungs.get(file, (JPEG_QUALITY, 1.0))
+            scale *= options.img_scale
+            encoding = self.encoding_of(options, lossy_source)
+            if encoding == 'fax':
+                key = (clip, scale, options.color_mode, encoding)
+            elif encoding == 'lossless':
+                key = (clip, scale, options.color_mode, encoding, options.compression_level)
+            else:
+                key = (clip, scale, options.color_mode, encoding, options.optimize, quality)
+            if key not in encodings:
+                img = self.prepare_image(file, clip, scale, options.color_mode, images)
+                image = self.encode_prepared(img, options, quality, lossy_source)
+                if clip:
+                    left, top, right, bottom = (round(v*scale) for v in file.crop_box())
+                    image.crop_box = (left, top, min(right, image.width), min(bottom, image.height))
+                encodings[key] = image
+            encoded.append(encodings[key])
+        return encoded
+
+    @staticmethod
+    def create_writer(options: SaveOptions) -> PdfWriter:
+        if options.append and os.path.isfile(options.save_path):
+            writer_class = AppendingPdfWriter
+        else:
+            writer_class = LinearizedPdfWriter if options.fast_web_view else PdfWriter
+        return writer_class(options.save_path, options.resolution)
+
+    @staticmethod
+    def create_double_page(writer: PdfWriter, img_left=None, img_right=None):
+        """
+        add a page with the two images placed side by side; a missing image leaves its half of the page empty
+        :param writer: PdfWriter of the file
+        :param img_left: EncodedImage for the left half
+        :param img_right: EncodedImage for the right half
+        :return:
+        """
         width = 0
         height = 0
 
         if img_left is not None:
-            width += img_left.width if img_right is not None else img_left.width * 2
-            height = max(height, img_left.height)
+            width += img_left.shown_width if img_right is not None else img_left.shown_width * 2
+            height = max(height, img_left.shown_height)
         if img_right is not None:
-            width += img_right.width if img_left is not None else img_right.width * 2
-            height = max(height, img_right.height)
-
-        if to_grayscale:
-            page = Image.new('L', (width, height), 255)
-        else:
-            page = Image.new('RGB', (width, height), (255, 255, 255))
+            width += img_right.shown_width if img_left is not None else img_right.shown_width * 2
+            height = max(height, img_right.shown_height)
 
+        placements = list()
         if img_left is not None:
-            page.paste(img_left,
-                       (0, (height - img_left.height) // 2))  # place img on left edge, centered horizontally
+            # place img on left edge, centered vertically
+            placements.append(ImagePlacement.from_image(writer.add_image(img_left), img_left,
+                                                        0, (height - img_left.shown_height) / 2))
         if img_right is not None:
-            page.paste(img_right, (width - img_right.width, (height - img_right.height) // 2))
-
-        return page
-
-    def create_single_page_list(self):
-        page_list = list()
-        if self.files:
-            for i, f in enumerate(self.files):
-                img = f.crop()
-                img = img.resize((int(img.width*self.img_scale), int(img.height*self.img_scale)))
-                if self.to_grayscale:
-                    img = img.convert('L')
-                    page = Image.new('L', (img.width, img.height))
-                else:
-                    page = Image.new('RGB', (img.width, img.height))
-                page.paste(img, (0, 0))
-                page_list.append(page)
-                self.signal.progress.emit(i)
-        return page_list
-
-    def create_double_page_list(self):
-        page_list = list()
-        if self.files:
-            start_index = 0
-            if self.separate_cover:
-                start_index = 1
-                page_list.append(self.files[0].crop())
-            for i in range(start_index, len(self.files), 2):
-                img1 = self.files[i].crop()
-                img1 = img1.resize((img1.width*self.img_scale, img1.height*self.img_scale))
-                if self.to_grayscale:
-                    img1.convert('L')
-                if i + 1 < len(self.files):
-                    img2 = self.files[i + 1].crop()
-                    img2 = img2.resize((img2.width*self.img_scale, img2.height*self.img_scale))
-                    if self.to_grayscale:
-                        img2.convert('L')
-                    if self.right_to_left:
-                        page_list.append(self.create_double_page(img2, img1, self.to_grayscale))
-                    else:
-                        page_list.append(self.create_double_page(img1, img2, self.to_grayscale))
+            placements.append(ImagePlacement.from_image(writer.add_image(img_right), img_right,
+                                                        width - img_right.shown_width,
+                                                        (height - img_right.shown_height) / 2))
+        writer.add_page(width, height, placements)
+
+    @staticmethod
+    def create_single_page(writer: PdfWriter, img: EncodedImage):
+        writer.add_page(img.shown_width, img.shown_height,
+                        [ImagePlacement.from_image(writer.add_image(img), img, 0, 0)])
+
+    def encoded_files(self):
+        """
+        encode the files on several threads, a few ahead of the one being written, and return them in order;
+        every page of a multi-page file is decoded on its own, so they are extracted in parallel as well
+        :return: generator of the results of encode_file
+        """
+        with ThreadPoolExecutor(max_workers=EXPORT_THREADS) as executor:
+            pending = deque()
+            for file in self.files:
+                pending.append(executor.submit(self.encode_file, file))
+                if len(pending) > EXPORT_THREADS:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def create_single_pages(self, writers: list[PdfWriter]):
+        for i, images in enumerate(self.encoded_files()):
+            for writer, img in zip(writers, images):
+                self.create_single_page(writer, img)
+            self.signal.progress.emit(self.progress_offset + i)
+
+    def create_double_pages(self, writers: list[PdfWriter]):
+        encoded = self.encoded_files()
+        start_index = 0
+        if self.separate_cover:
+            start_index = 1
+            for writer, img in zip(writers, next(encoded)):
+                self.create_single_page(writer, img)
+        for i in range(start_index, len(self.files), 2):
+            images1 = next(encoded)
+            if i + 1 < len(self.files):
+                images2 = next(encoded)
+            else:
+                images2 = [None] * len(writers)     # last page only gets one image
+            for writer, img1, img2 in zip(writers, images1, images2):
+                if self.right_to_left:
+                    self.create_double_page(writer, img2, img1)
                 else:
-                    if self.right_to_left:
-                        page_list.append(self.create_double_page(img_right=img1, to_grayscale=self.to_grayscale))
+                    self.create_double_page(writer, img1, img2)
+
+            self.signal.progress.emit(self.progress_offset + i)
+
+    def strip_cut(self, page: Image.Image):
+        """
+        :param page: full page of a long strip
+        :return: height at which the page is cut, the rows below it go to the next page
+        """
+        search_top = page.height - round(page.height * STRIP_GAP_SEARCH)
+        if not self.cut_at_gaps or page.height - search_top < 3:
+            return page.height
+        return search_top + find_gap(page.crop((0, search_top, page.width, page.height)))
+
+    def strip_pages(self):
+        """
+        join the cropped images top to bottom into one strip and cut it into pages of the same height,
+        or a little less when cutting at gaps. Narrower images are centered.
+        The strip is never assembled as a whole, only the page being filled and the current image are held;
+        the images are decoded past the shared DecodeCache, which would keep them all around
+        :return: generator of the page images
+        """
+        width = max(max(1, right - left) for left, _, right, _ in (f.crop_box() for f in self.files))
+        height = max(1, round(width * STRIP_PAGE_RATIO))
+        page = Image.new('RGB', (width, height), 'white')
+        filled = 0
+        for i, file in enumerate(self.files):
+            img = self.prepare_image(file, False, 1.0, ColorModes.COLOR,
+                                     {(True, 1.0, ColorModes.COLOR): DecodeCache.decode(file)})
+            left = (width - img.width) // 2
+            top = 0
+            while top < img.height:
+                rows = min(img.height - top, height - filled)
+                page.paste(img.crop((0, top, img.width, top + rows)), (left, filled))
+                top += rows
+                filled += rows
+                if filled == height:
+                    cut = self.strip_cut(page)
+                    yield page.crop((0, 0, width, cut))
+                    rest = page.crop((0, cut, width, height))
+                    page = Image.new('RGB', (width, height), 'white')
+                    page.paste(rest, (0, 0))
+                    filled = rest.height
+            del img     # free the image before the next one is decoded
+            self.signal.progress.emit(self.progress_offset + i)
+        if filled:
+            yield page.crop((0, 0, width, filled))
+
+    def create_strip_pages(self, writers: list[PdfWriter]):
+        for i, page in enumerate(self.strip_pages()):
+            for writer, img in zip(writers, self.encode_images(i, {(False, 1.0, ColorModes.COLOR): page})):
+                self.create_single_page(writer, img)
+
+    def run(self):
+        self.signal.started.emit()
+        try:
+            if self.files:
+                self.allocate()
+                with ExitStack() as stack:
+                    writers = [stack.enter_context(self.create_writer(o)) for o in self.profiles]
+                    if self.long_strip:
+                        self.create_strip_pages(writers)
+                    elif self.double_pages:
+                        self.create_double_pages(writers)
                     else:
-                        page_list.append(self.create_double_page(img_left=img1, to_grayscale=self.to_grayscale))
+                        self.create_single_pages(writers)
+        except (OSError, ValueError) as e:
+            self.signal.failed.emit(str(e))
+            return
+        self.signal.finished.emit()
 
-                self.signal.progress.emit(i)
-        return page_list
+
+class EstimateRunnable(SavingRunnable):
+    """
+    QRunnable that encodes a stratified sample of the files with every profile and extrapolates the size of the
+    PDFs and the duration of the export from it
+    """
+    class EstimateSignal(QObject):
+        estimated = pyqtSignal(int, list, float)    # emits generation, size of each PDF in bytes and duration in s
+        failed = pyqtSignal(int, str)   # emits generation and error message
+
+    def __init__(self, sample: list[tuple[ImageFile, int]], page_count: int, profiles: list[SaveOptions],
+                 generation: int, decode_cache: DecodeCache, decode_times: dict):
+        super(EstimateRunnable, self).__init__([f for f, _ in sample], profiles, False, False, False, decode_cache)
+        self.sample = sample
+        self.page_count = page_count
+        self.generation = generation
+        self.decode_times = decode_times    # path and frame -> time it took to decode the file without cache
+        self.decoded = set()    # path and frame of the files whose decoding time is counted already
+        self.decode_correction = 0
+        self.cancelled = False
+        self.signal = EstimateRunnable.EstimateSignal()
+
+    @staticmethod
+    def stratified_sample(files: list[ImageFile], sample_size: int = ESTIMATE_SAMPLE_SIZE):
+        """
+        split the files into groups of similar format and size and pick the middle file of each group
+        :param files: all files of the export
+        :param sample_size: number of groups
+        :return: list of (file, number of files it represents)
+        """
+        def pixels(f):
+            left, top, right, bottom = f.crop_box()
+            return max(0, right - left) * max(0, bottom - top)
+
+        ordered = sorted(files, key=lambda f: (f.suffix, pixels(f)))
+        count = min(sample_size, len(ordered))
+        sample = list()
+        for i in range(count):
+            stratum = ordered[i * len(ordered) // count:(i + 1) * len(ordered) // count]
+            sample.append((stratum[len(stratum) // 2].copy(), len(stratum)))
+        return sample
+
+    def decode(self, file: ImageFile):
+        # files decoded for an earlier estimate come from the cache, count the time they originally took once
+        start = time.perf_counter()
+        img = super(EstimateRunnable, self).decode(file)
+        elapsed = time.perf_counter() - start
+        key = (file.absolute_path, file.frame)
+        if key not in self.decoded:
+            self.decoded.add(key)
+            self.decode_correction += self.decode_times.setdefault(key, elapsed) - elapsed
+        return img
+
+    def run(self):
+        overhead = PDF_FILE_OVERHEAD + PDF_PAGE_OVERHEAD * self.page_count
+        sizes = [overhead + appended_size(o) for o in self.profiles]
+        stats = list()
+        ladder_duration = 0
+        encode_duration = 0
+        try:
+            for file, weight in self.sample:
+                if self.cancelled:
+                    return
+                self.decode_correction = 0
+                start = time.perf_counter()
+                if any(o.target_size for o in self.profiles):
+                    stats.append(self.measure_ladder(file))
+                    ladder_duration += weight * (time.perf_counter() - start + self.decode_correction)
+                    self.decode_correction = 0
+                    start = time.perf_counter()
+                encoded = self.encode_file(file)
+                encode_duration += weight * (time.perf_counter() - start + self.decode_correction)
+                # the pages of a target size are added once their rungs are chosen below
+                sizes = [size + (weight * len(img.stream) if not o.target_size else 0)
+                         for size, img, o in zip(sizes, encoded, self.profiles)]
+        except (OSError, ValueError) as e:
+            if not self.cancelled:  # the export will report the error as well
+                self.signal.failed.emit(self.generation, str(e))
+            return
+
+        # the sample files stand in for all pages when the rungs of a target size are chosen
+        weights = [weight for _, weight in self.sample]
+        for index, options in enumerate(self.profiles):
+            if options.target_size:
+                profile_stats = [s[index] for s in stats]
+                choice = allocate_rungs(profile_stats, options.target_size - sizes[index], weights)
+                sizes[index] += sum(w * rungs[j][0] for w, rungs, j in zip(weights, profile_stats, choice))
+        # the sample is measured one page at a time, the export measures and encodes several pages at once
+        duration = (ladder_duration / max(1, min(LADDER_THREADS, self.page_count))
+                    + encode_duration / max(1, min(EXPORT_THREADS, self.page_count)))
+        if not self.cancelled:
+            self.signal.estimated.emit(self.generation, sizes, duration)
+
+
+class PreEncodeRunnable(SavingRunnable):
+    """
+    QRunnable that encodes files ahead of an export and stores the results in an EncodingCache.
+    It works on one file at a time with low priority, so it can be stopped quickly when the user edits again
+    """
+    def __init__(self, files: list[ImageFile], profiles: list[SaveOptions], encoding_cache: EncodingCache):
+        super(PreEncodeRunnable, self).__init__(files, profiles, False, False, False, encoding_cache=encoding_cache)
+        self.cancelled = False
 
     def run(self):
-        if self.double_pages:
-            page_list = self.create_double_page_list()
+        QThread.currentThread().setPriority(QThread.Priority.LowPriority)
+        for file in self.files:
+            if self.cancelled:
+                return
+            if all(self.encoding_cache.get(file, o) is not None for o in self.profiles):
+                continue
+            try:
+                encoded = self.encode_file(file)
+            except (OSError, ValueError):
+                continue    # the export will report the error
+            for options, image in zip(self.profiles, encoded):
+                if not self.encoding_cache.put(file, options, image):
+                    return  # full, the rest is left to the export
+
+
+class ExportQueue(QObject):
+    """
+    Schedules export jobs on a bounded thread pool by their priority. Jobs share one cache of decoded source images,
+    jobs writing to one of the same files wait until the earlier one is done
+    """
+    def __init__(self, max_jobs: int = MAX_CONCURRENT_EXPORTS):
+        super(ExportQueue, self).__init__()
+        self.thread_pool = QThreadPool()
+        self.thread_pool.setMaxThreadCount(max_jobs)
+        self.decode_cache = DecodeCache()
+        self.scheduled = dict()     # queued or running job -> priority
+        self.waiting = list()       # (job, priority) of jobs whose files are still written by another job
+        self.top_priority = 0
+
+    @staticmethod
+    def __targets(job: SavingRunnable):
+        return {os.path.normcase(os.path.abspath(o.save_path)) for o in job.profiles}
+
+    def __is_blocked(self, job: SavingRunnable):
+        return any(self.__targets(j) & self.__targets(job) for j in self.scheduled)
+
+    def __start(self, job: SavingRunnable, priority: int):
+        self.scheduled[job] = priority
+        self.thread_pool.start(job, priority)
+
+    def submit(self, job: SavingRunnable, priority: int = 0):
+        """
+        queue an export job
+        :param job: SavingRunnable of the export
+        :param priority: jobs with higher priority are started first
+        :return:
+        """
+        job.decode_cache = self.decode_cache
+        job.setAutoDelete(False)    # the queue keeps the job until it is done
+        job.signal.finished.connect(lambda: self.job_done(job))
+        job.signal.failed.connect(lambda: self.job_done(job))
+        if self.__is_blocked(job):
+            self.waiting.append((job, priority))
         else:
-            page_list = self.create_single_page_list()
-        page_list[0].save(self.filename, 'PDF', optimize=self.optimize, dpi=(self.resolution, self.resolution),
-                          compress_level=self.compression_level, save_all=True, append_images=(p for p in page_list[1:]))
-        self.signal.finished.emit()
+            self.__start(job, priority)
+
+    def prioritize(self, job: SavingRunnable):
+        """
+        move a job that hasn't started yet to the front of the queue
+        :param job: queued SavingRunnable
+        :return:
+        """
+        self.top_priority += 1
+        if job in self.scheduled:
+            if self.thread_pool.tryTake(job):
+                self.__start(job, self.top_priority)
+        else:
+            self.waiting = [(j, self.top_priority if j is job else p) for j, p in self.waiting]
+
+    def job_done(self, job: SavingRunnable):
+        """
+        start the jobs that waited for this one and free the decoded images once the queue is empty
+        :param job: finished SavingRunnable
+        :return:
+        """
+        self.scheduled.pop(job, None)
+        for waiting in sorted(self.waiting, key=lambda w: w[1], reverse=True):
+            if not self.__is_blocked(waiting[0]):
+                self.waiting.remove(waiting)
+                self.__start(*waiting)
+        if not self.scheduled:
+            self.decode_cache.clear()
+
+
+class PreEncoder(QObject):
+    """
+    Encodes the loaded files with the last used profiles in the background while the user reviews them,
+    so an export mostly only has to write the PDF. Work starts once nothing was edited for a moment and skips the
+    previewed file, whose margins are most likely still changing. Images whose file or profile has changed since
+    are dropped before every run
+    """
+    def __init__(self, files: list[ImageFile]):
+        super(PreEncoder, self).__init__()
+        self.files = files      # loaded files, shared with the MainWindow
+        self.profiles = list()
+        self.current_file = None
+        self.paused = False
+        self.cache = EncodingCache()
+        self.job = None
+        self.thread_pool = QThreadPool()
+        self.thread_pool.setMaxThreadCount(1)
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(PREENCODE_DELAY_MS)
+        self.timer.timeout.connect(self.start)
+
+    def __cancel(self):
+        self.timer.stop()
+        if self.job is not None:
+            self.job.cancelled = True
+            self.job = None
+
+    @pyqtSlot()
+    def schedule(self):
+        """
+        stop encoding and start over once the files weren't edited for a moment
+        :return:
+        """
+        self.__cancel()
+        if not self.paused:
+            self.timer.start()
+
+    def set_profiles(self, profiles: list[SaveOptions]):
+        # pages for a target size depend on all the others and are chosen by the export itself
+        self.profiles = [p.copy() for p in profiles if not p.target_size]
+        self.schedule()
+
+    def set_current_file(self, file: ImageFile):
+        self.current_file = file
+        self.schedule()
+
+    def pause(self):
+        """
+        leave the CPU to an export until resume is called
+        :return:
+        """
+        self.paused = True
+        self.__cancel()
+
+    def resume(self):
+        self.paused = False
+        self.schedule()
+
+    @pyqtSlot()
+    def start(self):
+        self.cache.retain(self.files, self.profiles)
+        if self.profiles and not self.paused:
+            files = [f.copy() for f in self.files if f is not self.current_file]
+            self.job = PreEncodeRunnable(files, self.profiles, self.cache)
+            self.thread_pool.start(self.job)
+
+    def stop(self):
+        self.__cancel()
+        self.cache.clear()
 
 
 class SaveDialog(QDialog):
-    # emits path, if grayscale, if optimize, compression level, resolution and resize factor
-    confirmedOptions = pyqtSignal(str, bool, bool, int, int, float)
+    confirmedProfiles = pyqtSignal(list)    # emits the chosen SaveOptions, one for each PDF
 
-    def __init__(self, default_path: str, parent=None):
+    def __init__(self, default_path: str, profiles: list[SaveOptions] = None, files: list[ImageFile] = None,
+                 parent=None):
         super(SaveDialog, self).__init__(parent)
         self.setWindowTitle('Save Options')
 
-        self.save_path = default_path + '/imagesTo.pdf'
-        self.to_grayscale = False
-        self.optimize = False
-        self.compression_level = 6
-        self.resolution = 300
-        self.img_scale = 1.0
+        # estimate of the result, renewed shortly after the options stopped changing
+        self.sample = EstimateRunnable.stratified_sample(files) if files else list()
+        self.page_count = len(files) if files else 0
+        self.decode_cache = DecodeCache()
+        self.decode_times = dict()
+        self.estimate = None
+        self.generation = 0
+        self.estimated_sizes = list()
+        self.estimated_duration = 0
+        self.estimate_timer = QTimer(self)
+        self.estimate_timer.setSingleShot(True)
+        self.estimate_timer.setInterval(ESTIMATE_DELAY_MS)
+        self.estimate_timer.timeout.connect(self.start_estimate)
+        self.estimate_lbl = QLabel()
+        self.estimate_lbl.setStyleSheet('font-style: italic;')
+        self.estimate_lbl.setHidden(not self.sample)
+
+        self.profiles = [p.copy() for p in profiles] if profiles else [SaveOptions()]
+        if not self.profiles[0].save_path:
+            self.profiles[0].save_path = default_path + '/imagesTo.pdf'
+        self.options = self.profiles[0]     # profile shown in the dialog
+
+        self.profile_tabs = QTabBar()
+        self.profile_tabs.setExpanding(False)
+        for options in self.profiles:
+            self.profile_tabs.addTab(os.path.basename(options.save_path))
+        self.profile_tabs.currentChanged.connect(self.select_profile)
+
+        add_btn = QPushButton('add profile')
+        add_btn.setToolTip('create another PDF from the same images in one go')
+        add_btn.clicked.connect(self.add_profile)
+        self.remove_btn = QPushButton('remove profile')
+        self.remove_btn.clicked.connect(self.remove_profile)
+        self.remove_btn.setEnabled(len(self.profiles) > 1)
 
         self.warning_lbl = QLabel()
         self.warning_lbl.setStyleSheet('font-style: italic;')
         self.path_is_valid = True
         self.path_edt = QLineEdit()
-        self.path_edt.setText(self.save_path)
         self.path_edt.textEdited.connect(self.set_save_path)
 
-        bw_check = QCheckBox('convert to grayscale')
-        bw_check.stateChanged.connect(self.set_grayscale)
-        bw_check.setChecked(self.to_grayscale)
+        self.color_box = QComboBox()
+        for mode in ColorModes:
+            self.color_box.addItem(mode.value)
+        self.color_box.setToolTip('black and white pages are much smaller, best for scanned text')
+        self.color_box.currentTextChanged.connect(lambda t: self.set_color_mode(ColorModes(t)))
+
+        self.optimize_check = QCheckBox('optimize for file size')
+        self.optimize_check.stateChanged.connect(self.set_optimize)
+
+        self.crop_check = QCheckBox('crop inside PDF (lossless)')
+        self.crop_check.setToolTip('embed the original images and hide the cropped areas instead of re-encoding them')
+        self.crop_check.stateChanged.connect(self.set_crop_in_pdf)
 
-        optimize_check = QCheckBox('optimize for file size')
-        optimize_check.stateChanged.connect(self.set_optimize)
-        optimize_check.setChecked(self.optimize)
+        self.web_check = QCheckBox('fast web view (linearized)')
+        self.web_check.setToolTip('arrange the file so that viewers can show the first page before the rest is loaded')
+        self.web_check.stateChanged.connect(self.set_fast_web_view)
 
-        compression_slider = CustomSlider(0, 10, self.compression_level)
-        compression_slider.set_extrema_label_text('no\ncompression', 'max\ncompression')
-        compression_slider.valueChanged.connect(self.set_compression)
+        self.append_check = QCheckBox('append to existing PDF')
+        self.append_check.setToolTip('add the pages to the end of the PDF at this path instead of replacing it')
+        self.append_check.stateChanged.connect(self.set_append)
 
-        resolution_edt = CustomIntEdit(self.resolution, 'dpi')
-        resolution_edt.valueChanged.connect(self.set_resolution)
+        self.compression_slider = CustomSlider(0, 10, self.options.compression_level)
+        self.compression_slider.set_extrema_label_text('no\ncompression', 'max\ncompression')
+        self.compression_slider.valueChanged.connect(self.set_compression)
 
-        scale_edt = CustomIntEdit(int(self.img_scale*100), '%')
-        scale_edt.valueChanged.connect(self.set_img_scale)
+        self.resolution_edt = CustomIntEdit(self.options.resolution, 'dpi')
+        self.resolution_edt.valueChanged.connect(self.set_resolution)
+
+        self.scale_edt = CustomIntEdit(int(self.options.img_scale*100), '%')
+        self.scale_edt.valueChanged.connect(self.set_img_scale)
+
+        self.target_edt = CustomIntEdit(self.options.target_size // 1000000, 'MB, 0 for no limit')
+        self.target_edt.setToolTip('choose the quality and scale of every page so that the PDF fits into this size')
+        self.target_edt.valueChanged.connect(self.set_target_size)
+
+        self.__show_profile()
 
         save_btn = QPushButton('save')
         save_btn.clicked.connect(self.on_save_press)
@@ -161,71 +1100,237 @@ class SaveDialog(QDialog):
         browse_btn.setSizePolicy(QSizePolicy.Policy.Fixed, QSizePolicy.Policy.Fixed)
         browse_btn.clicked.connect(self.select_file)
 
+        profile_layout = QHBoxLayout()
+        profile_layout.addWidget(self.profile_tabs)
+        profile_layout.addStretch()
+        profile_layout.addWidget(add_btn)
+        profile_layout.addWidget(self.remove_btn)
+
         layout = QGridLayout(self)
-        layout.addWidget(QLabel('path: '), 0, 0)
-        layout.addWidget(self.path_edt, 0, 1, 1, 2)
-        layout.addWidget(browse_btn, 0, 3)
-        layout.addWidget(self.warning_lbl, 1, 1, 1, -1)
+        layout.addLayout(profile_layout, 0, 0, 1, -1)
+
+        layout.addWidget(QLabel('path: '), 1, 0)
+        layout.addWidget(self.path_edt, 1, 1, 1, 2)
+        layout.addWidget(browse_btn, 1, 3)
+        layout.addWidget(self.warning_lbl, 2, 1, 1, -1)
+
+        layout.addWidget(QLabel('compression level: '), 3, 0)
+        layout.addWidget(self.compression_slider, 3, 1)
+
+        layout.addWidget(QLabel('resolution: '), 4, 0)
+        layout.addWidget(self.resolution_edt, 4, 1)
 
-        layout.addWidget(QLabel('compression level: '), 2, 0)
-        layout.addWidget(compression_slider, 2, 1)
+        layout.addWidget(QLabel('image scale: '), 5, 0)
+        layout.addWidget(self.scale_edt, 5, 1)
 
-        layout.addWidget(QLabel('resolution: '), 3, 0)
-        layout.addWidget(resolution_edt, 3, 1)
+        layout.addWidget(QLabel('size limit: '), 6, 0)
+        layout.addWidget(self.target_edt, 6, 1)
 
-        layout.addWidget(QLabel('image scale: '), 4, 0)
-        layout.addWidget(scale_edt, 4, 1)
+        layout.addWidget(QLabel('colors: '), 7, 0)
+        layout.addWidget(self.color_box, 7, 1)
+        layout.addWidget(self.optimize_check, 8, 1, 1, -1)
+        layout.addWidget(self.crop_check, 9, 1, 1, -1)
+        layout.addWidget(self.web_check, 10, 1, 1, -1)
+        layout.addWidget(self.append_check, 11, 1, 1, -1)
 
-        layout.addWidget(bw_check, 5, 1, 1, -1)
-        layout.addWidget(optimize_check, 6, 1, 1, -1)
+        layout.addItem(QSpacerItem(15, 15), 12, 0)
+        layout.addWidget(self.estimate_lbl, 13, 0, 1, -1)
+        layout.addWidget(save_btn, 14, 0, 1, -1)
 
-        layout.addItem(QSpacerItem(15, 15), 7, 0)
-        layout.addWidget(save_btn, 8, 0, 1, -1)
+        self.schedule_estimate()
+
+    def __show_profile(self):
+        """
+        set the controls to the values of the current profile without writing them back
+        :return:
+        """
+        controls = (self.color_box, self.optimize_check, self.crop_check, self.web_check, self.append_check,
+                    self.compression_slider, self.resolution_edt, self.scale_edt, self.target_edt)
+        for control in controls:
+            control.blockSignals(True)
+        self.warning_lbl.setText('')
+        self.path_is_valid = True
+        self.path_edt.setText(self.options.save_path)
+        self.color_box.setCurrentText(self.options.color_mode.value)
+        self.optimize_check.setChecked(self.options.optimize)
+        self.crop_check.setChecked(self.options.crop_in_pdf)
+        self.web_check.setChecked(self.options.fast_web_view)
+        self.web_check.setEnabled(not self.options.append)  # an appended file can't be linearized
+        self.append_check.setChecked(self.options.append)
+        self.compression_slider.set_value(str(self.options.compression_level))
+        self.resolution_edt.set_value(self.options.resolution)
+        self.scale_edt.set_value(int(self.options.img_scale*100))
+        self.target_edt.set_value(self.options.target_size // 1000000)
+        self.crop_check.setEnabled(not self.options.target_size)    # the target size needs re-encoded pages
+        for control in controls:
+            control.blockSignals(False)
+
+    @pyqtSlot(int)
+    def select_profile(self, index: int):
+        self.options = self.profiles[index]
+        self.__show_profile()
+        self.show_estimate()
+
+    def schedule_estimate(self):
+        """
+        discard the current estimate and start a new one once the options didn't change for a moment
+        :return:
+        """
+        if not self.sample:
+            return
+        self.generation += 1
+        if self.estimate is not None:
+            self.estimate.cancelled = True
+            self.estimate = None
+        self.estimate_lbl.setText('estimating size...')
+        self.estimate_timer.start()
+
+    @pyqtSlot()
+    def start_estimate(self):
+        self.estimate = EstimateRunnable(self.sample, self.page_count, [p.copy() for p in self.profiles],
+                                         self.generation, self.decode_cache, self.decode_times)
+        self.estimate.signal.estimated.connect(self.set_estimate)
+        self.estimate.signal.failed.connect(self.set_estimate_failed)
+        QThreadPool.globalInstance().start(self.estimate)
+
+    @pyqtSlot(int, list, float)
+    def set_estimate(self, generation: int, sizes: list[int], duration: float):
+        if generation == self.generation:
+            self.estimate = None
+            self.estimated_sizes = sizes
+            self.estimated_duration = duration
+            self.estimate_lbl.setToolTip('')
+            self.show_estimate()
+
+    @pyqtSlot(int, str)
+    def set_estimate_failed(self, generation: int, message: str):
+        """
+        a file of the sample couldn't be encoded, e.g. because it was moved
+        :param generation: generation of the failed estimate
+        :param message: error message
+        :return:
+        """
+        if generation == self.generation:
+            self.estimate = None
+            self.estimated_sizes = list()
+            self.estimate_lbl.setText('estimate unavailable')
+            self.estimate_lbl.setToolTip(message)
+
+    def show_estimate(self):
+        index = self.profile_tabs.currentIndex()
+        if self.estimate is None and not self.estimate_timer.isActive() and index < len(self.estimated_sizes):
+            size = self.estimated_sizes[index]
+            if self.options.target_size and size > self.options.target_size:
+                text = f'the size limit can\'t be reached, smallest size: {format_size(size)}, '
+            else:
+                text = f'estimated size: {format_size(size)}, '
+            self.estimate_lbl.setText(text + f'duration of the export: {format_duration(self.estimated_duration)}')
+
+    def done(self, result: int):
+        self.estimate_timer.stop()
+        if self.estimate is not None:
+            self.estimate.cancelled = True
+        super(SaveDialog, self).done(result)
+
+    @pyqtSlot()
+    def add_profile(self):
+        """
+        add a copy of the current profile, saved next to its file under a new name
+        :return:
+        """
+        profile = self.options.copy()
+        base = os.path.splitext(self.options.save_path)[0]
+        paths = {p.save_path for p in self.profiles}
+        number = 2
+        while f'{base}_{number}.pdf' in paths:
+            number += 1
+        profile.save_path = f'{base}_{number}.pdf'
+        self.profiles.append(profile)
+        self.profile_tabs.addTab(os.path.basename(profile.save_path))
+        self.profile_tabs.setCurrentIndex(len(self.profiles) - 1)
+        self.remove_btn.setEnabled(True)
+        self.schedule_estimate()
+
+    @pyqtSlot()
+    def remove_profile(self):
+        if len(self.profiles) > 1:
+            index = self.profile_tabs.currentIndex()
+            del self.profiles[index]
+            self.profile_tabs.removeTab(index)
+            self.remove_btn.setEnabled(len(self.profiles) > 1)
+            self.schedule_estimate()
 
     def set_save_path(self, path):
         suffix = os.path.splitext(path)[1]
         if suffix.lower() == '.pdf':
             self.warning_lbl.setText('')
-            self.save_path = path
+            self.options.save_path = path
             self.path_is_valid = True
             self.path_edt.setText(path)
+            self.profile_tabs.setTabText(self.profile_tabs.currentIndex(), os.path.basename(path))
         else:
             self.warning_lbl.setText('invalid path!')
             self.path_is_valid = False
 
     @pyqtSlot()
     def select_file(self):
-        filename = QFileDialog.getSaveFileName(self, 'Save File', '', 'PDF Files  (*.pdf)')[0]
+        # appending to a file doesn't overwrite it
+        dialog_options = QFileDialog.Option.DontConfirmOverwrite if self.options.append else QFileDialog.Option(0)
+        filename = QFileDialog.getSaveFileName(self, 'Save File', '', 'PDF Files  (*.pdf)', options=dialog_options)[0]
         self.set_save_path(filename)
 
-    @pyqtSlot(int)
-    def set_grayscale(self, to_gray: int):
-        self.to_grayscale = bool(to_gray)
+    @pyqtSlot(ColorModes)
+    def set_color_mode(self, color_mode: ColorModes):
+        self.options.color_mode = color_mode
+        self.schedule_estimate()
 
     @pyqtSlot(int)
     def set_optimize(self, optimize: int):
-        self.optimize = bool(optimize)
+        self.options.optimize = bool(optimize)
+        self.schedule_estimate()
+
+    @pyqtSlot(int)
+    def set_crop_in_pdf(self, crop_in_pdf: int):
+        self.options.crop_in_pdf = bool(crop_in_pdf)
+        self.schedule_estimate()
+
+    @pyqtSlot(int)
+    def set_fast_web_view(self, fast_web_view: int):
+        self.options.fast_web_view = bool(fast_web_view)
+
+    @pyqtSlot(int)
+    def set_append(self, append: int):
+        self.options.append = bool(append)
+        self.web_check.setEnabled(not self.options.append)
+        self.schedule_estimate()
 
     @pyqtSlot(int)
     def set_compression(self, value: int):
-        self.compression_level = value
+        self.options.compression_level = value
+        self.schedule_estimate()
 
     @pyqtSlot(int)
     def set_resolution(self, value: int):
-        self.resolution = value
+        self.options.resolution = value
 
     @pyqtSlot(int)
     def set_img_scale(self, value: int):
-        self.img_scale = value/100
+        self.options.img_scale = value/100
+        self.schedule_estimate()
+
+    @pyqtSlot(int)
+    def set_target_size(self, value: int):
+        self.options.target_size = value * 1000000
+        self.crop_check.setEnabled(not self.options.target_size)
+        self.schedule_estimate()
 
     @pyqtSlot()
     def on_save_press(self):
-        self.confirmedOptions.emit(self.save_path,
-                                   self.to_grayscale,
-                                   self.optimize,
-                                   self.compression_level,
-                                   self.resolution,
-                                   self.img_scale)
+        paths = [os.path.normcase(os.path.abspath(p.save_path)) for p in self.profiles]
+        if len(set(paths)) < len(paths):
+            self.warning_lbl.setText('every profile needs its own path!')
+            return
+        self.confirmedProfiles.emit([p.copy() for p in self.profiles])
         self.close()
 
 
@@ -287,102 +1392,73 @@ class CustomIntEdit(QWidget):
 
     def __init__(self, default: int, unit: str):
         super(CustomIntEdit, self).__init__()
-        edt = QLineEdit(str(default))
-        edt.setValidator(QIntValidator(0, 999))
-        edt.setFixedWidth(edt.fontMetrics().horizontalAdvance('0')*8)
-        edt.setAlignment(Qt.AlignmentFlag.AlignRight)
+        self.edt = QLineEdit(str(default))
+        self.edt.setValidator(QIntValidator(0, 999))
+        self.edt.setFixedWidth(self.edt.fontMetrics().horizontalAdvance('0')*8)
+        self.edt.setAlignment(Qt.AlignmentFlag.AlignRight)
         unit_lbl = QLabel(unit)
         unit_lbl.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Preferred)
 
         layout = QHBoxLayout(self)
         layout.setContentsMargins(0, 0, 0, 0)
-        layout.addWidget(edt)
+        layout.addWidget(self.edt)
         layout.addWidget(unit_lbl)
 
-        edt.textChanged.connect(lambda t: self.valueChanged.emit(int(t)))
+        self.edt.textChanged.connect(lambda t: self.valueChanged.emit(int(t)) if t else None)
 
+    def set_value(self, value: int):
+        self.edt.setText(str(value))
 
-class SaveWidget(QWidget):
+
+class ExportJobWidget(QWidget):
     """
-    Menu that handles the PDF formatting and saving Progress
+    Progress view of a single export job
     """
-    startedSaving = pyqtSignal()
-    finishedSaving = pyqtSignal()
-
-    def __init__(self, files: list[ImageFile]):
-        super(SaveWidget, self).__init__()
-        self.files = files
-        self.right_to_left = False
-        self.double_pages = False
-        self.separate_cover = False
-
-        self.save_btn = QPushButton('create PDF')
+    def __init__(self, job: SavingRunnable, queue: ExportQueue):
+        super(ExportJobWidget, self).__init__()
+        self.job = job
+        self.queue = queue
+        self.done = False
+
+        name_lbl = QLabel(', '.join(os.path.basename(o.save_path) for o in job.profiles))
+        name_lbl.setToolTip('\n'.join(o.save_path for o in job.profiles))
+        self.status_lbl = QLabel('queued')
+        self.status_lbl.setStyleSheet('font-style: italic;')
         self.progress_bar = QProgressBar()
-        self.progress_lbl = QLabel('Saving...')
-        self.progress_bar.setHidden(True)
-        self.progress_lbl.setHidden(True)
-
-        layout = QVBoxLayout(self)
-        layout.addWidget(self.save_btn)
-        layout.addWidget(self.progress_bar)
-        layout.addWidget(self.progress_lbl)
-        self.save_btn.clicked.connect(self.open_save_dialog)
-
-    def open_save_dialog(self):
-        if self.files:
-            dialog = SaveDialog(os.path.dirname(self.files[0].absolute_path))
-            dialog.confirmedOptions.connect(self.save_pdf)
-            dialog.exec()
-
-    @pyqtSlot(bool)
-    def set_separate_cover(self, separate_cover: bool):
-        self.separate_cover = separate_cover
-
-    @pyqtSlot(bool, bool)
-    def set_pdf_layout(self, double_pages: bool, right_to_left: bool):
-        self.double_pages = double_pages
-        self.right_to_left = right_to_left
+        self.progress_bar.setMaximum(job.progress_steps())
+        self.progress_bar.setValue(0)
+        self.next_btn = QPushButton('run next')
+        self.next_btn.setToolTip('start this export before the other queued ones')
+        self.next_btn.setSizePolicy(QSizePolicy.Policy.Fixed, QSizePolicy.Policy.Fixed)
+        self.next_btn.clicked.connect(lambda: self.queue.prioritize(self.job))
 
-    @pyqtSlot()
-    def hide_progress(self):
-        if self.progress_bar.value() >= self.progress_bar.maximum():    # don't hide progress view while saving
-            self.progress_bar.setHidden(True)
-            self.progress_lbl.setHidden(True)
+        job.signal.started.connect(self.set_started)
+        job.signal.progress.connect(self.progress_bar.setValue)
+        job.signal.finished.connect(self.set_finished)
+        job.signal.failed.connect(self.set_failed)
 
-    @pyqtSlot(str, bool, bool, int, int, float)
-    def save_pdf(self, filename, to_gray, optimize, compress_lvl, res, img_scale):
-        """
-        get save location through QFileDialog and start Saving process
-        :return:
-        """
-        if self.files:
-            self.activate_progress_view()
-            saving = SavingRunnable(self.files, filename, self.separate_cover, self.right_to_left, self.double_pages,
-                                    to_gray, optimize, compress_lvl, res, img_scale)
-            saving.signal.progress.connect(self.progress)
-            saving.signal.finished.connect(lambda: self.progress(len(self.files)))
-            QThreadPool.globalInstance().start(saving)
-            self.startedSaving.emit()
+        layout = QGridLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(name_lbl, 0, 0)
+        layout.addWidget(self.status_lbl, 0, 1, Qt.AlignmentFlag.AlignRight)
+        layout.addWidget(self.progress_bar, 1, 0)
+        layout.addWidget(self.next_btn, 1, 1)
 
-    @pyqtSlot(int)
-    def set_progress_max(self, new_max: int):
-        self.progress_bar.setMaximum(new_max)
+    @pyqtSlot()
+    def set_started(self):
+        self.status_lbl.setText('saving...')
+        self.next_btn.setHidden(True)
 
-    @pyqtSlot(int)
-    def progress(self, value: int):
-        """
-        advance the progress bar and if finished emit signal for that
-        :param value: new value for progress bar
-        :return:
-        """
-        self.progress_bar.setValue(value)
-        if value == self.progress_bar.maximum():
-            self.progress_lbl.setText('Saving Completed!')
-            self.finishedSaving.emit()
+    @pyqtSlot()
+    def set_finished(self):
+        self.done = True
+        self.progress_bar.setValue(self.progress_bar.maximum())
+        self.status_lbl.setText('completed!')
+        self.next_btn.setHidden(True)
 
-    def activate_progress_view(self):
-        self.progress_bar.setHidden(False)
-        self.progress_lbl.setHidden(False)
-        self.set_progress_max(len(self.files))
-        self.progress_bar.setValue(0)
-        self.progress_lbl.setText('Saving...')
+    @pyqtSlot(str)
+    def set_failed(self, message: str):
+        self.done = True
+        self.status_lbl.setText('failed!')
+        self.status_lbl.setToolTip(message)
+        self.next_btn.setHidden(True)
@@ -0,0 +1,207 @@
+from PyQt6.QtWidgets import QListView, QAbstractItemView
+from PyQt6.QtGui import QImage, QImageReader, QPixmap, QColor
+from PyQt6.QtCore import (Qt, QObject, QRunnable, QThreadPool, QAbstractListModel, QModelIndex, QSize,
+                          pyqtSignal, pyqtSlot)
+
+from collections import OrderedDict
+import threading
+
+from structures import ImageFile
+
+
+THUMBNAIL_SIZE = 128
+MAX_CACHED_THUMBNAILS = 512     # ~32 MB of pixmaps at the default thumbnail size
+MAX_PENDING_THUMBNAILS = 64     # older requests are dropped, they most likely scrolled out of view already
+
+
+class ThumbnailLoader(QRunnable):
+    """
+    QRunnable that decodes downscaled thumbnails for the pending requests of a ThumbnailModel.
+    Always takes the most recent request first, so rows that just scrolled into view are served before older ones
+    """
+    class LoaderSignal(QObject):
+        loaded = pyqtSignal(tuple, QImage)  # emits file path and frame and its thumbnail
+        finished = pyqtSignal()
+
+    def __init__(self, pending: OrderedDict, lock: threading.Lock):
+        super(ThumbnailLoader, self).__init__()
+        self.pending = pending
+        self.lock = lock
+        self.signal = ThumbnailLoader.LoaderSignal()
+
+    @staticmethod
+    def load_thumbnail(path: str, frame: int = 0):
+        """
+        decode an image directly at thumbnail size; formats like JPEG skip most of the full-size decoding that way
+        :param path: path of the image file
+        :param frame: index of the page in a multi-page or animated image
+        :return: QImage, null if the file can't be read
+        """
+        reader = QImageReader(path)
+        if frame and not reader.jumpToImage(frame):
+            for _ in range(frame):  # animations can only be read frame by frame
+                reader.read()
+        size = reader.size()
+        if size.isValid():
+            reader.setScaledSize(size.scaled(THUMBNAIL_SIZE, THUMBNAIL_SIZE, Qt.AspectRatioMode.KeepAspectRatio))
+        return reader.read()
+
+    def run(self):
+        while True:
+            with self.lock:
+                if not self.pending:
+                    break
+                key = self.pending.popitem()[0]
+            self.signal.loaded.emit(key, self.load_thumbnail(*key))
+        self.signal.finished.emit()
+
+
+class ThumbnailModel(QAbstractListModel):
+    """
+    List model of the loaded files that provides their thumbnails as decoration. Thumbnails are only decoded once
+    a view asks for them, i.e. when their row becomes visible, and are kept in a cache of limited size
+    """
+    def __init__(self, files: list[ImageFile]):
+        super(ThumbnailModel, self).__init__()
+        self.files = files
+        self.rows = dict()      # file path and frame -> row, used to find the row of a finished thumbnail
+        self.cache = OrderedDict()
+        self.pending = OrderedDict()
+        self.lock = threading.Lock()
+        self.active_loaders = 0
+        self.thread_pool = QThreadPool()
+        self.thread_pool.setMaxThreadCount(max(1, QThreadPool.globalInstance().maxThreadCount() // 2))
+
+        self.placeholder = QPixmap(THUMBNAIL_SIZE, THUMBNAIL_SIZE)
+        self.placeholder.fill(QColor(192, 192, 192))
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()):
+        return 0 if parent.isValid() else len(self.files)
+
+    def data(self, index: QModelIndex, role: int = Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.files):
+            return None
+        file = self.files[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return f'{index.row() + 1}: {file.display_name()}' + (' (missing)' if file.missing else '')
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return file.absolute_path
+        if role == Qt.ItemDataRole.DecorationRole:
+            key = (file.absolute_path, file.frame)
+            pixmap = self.cache.get(key)
+            if pixmap is not None:
+                self.cache.move_to_end(key)
+                return pixmap
+            self.request(key)
+            return self.placeholder
+        return None
+
+    def request(self, key: tuple[str, int]):
+        """
+        queue the thumbnail of a file for loading and start another loader if there are free threads
+        :param key: path of the image file and index of the frame
+        :return:
+        """
+        with self.lock:
+            self.pending[key] = None
+            self.pending.move_to_end(key)
+            while len(self.pending) > MAX_PENDING_THUMBNAILS:
+                self.pending.popitem(last=False)
+        self.__start_loader()
+
+    def __start_loader(self):
+        if self.active_loaders < self.thread_pool.maxThreadCount():
+            self.active_loaders += 1
+            loader = ThumbnailLoader(self.pending, self.lock)
+            loader.signal.loaded.connect(self.set_thumbnail)
+            loader.signal.finished.connect(self.loader_finished)
+            self.thread_pool.start(loader)
+
+    @pyqtSlot()
+    def loader_finished(self):
+        """
+        count a loader as stopped; requests that came in after it found nothing left to do get a new one
+        :return:
+        """
+        self.active_loaders -= 1
+        with self.lock:
+            pending = bool(self.pending)
+        if pending:
+            self.__start_loader()
+
+    @pyqtSlot(tuple, QImage)
+    def set_thumbnail(self, key: tuple[str, int], image: QImage):
+        """
+        store a decoded thumbnail, evict the least recently shown ones and update the corresponding row
+        :param key: path of the image file and index of the frame
+        :param image: decoded thumbnail
+        :return:
+        """
+        self.cache[key] = QPixmap.fromImage(image) if not image.isNull() else self.placeholder
+        while len(self.cache) > MAX_CACHED_THUMBNAILS:
+            self.cache.popitem(last=False)
+        row = self.rows.get(key)
+        if row is not None:
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.ItemDataRole.DecorationRole])
+
+    @pyqtSlot()
+    def reset(self):
+        """
+        update the model after files were loaded or reordered; cached thumbnails stay valid
+        :return:
+        """
+        self.beginResetModel()
+        with self.lock:
+            self.pending.clear()
+        self.rows = {(f.absolute_path, f.frame): i for i, f in enumerate(self.files)}
+        self.endResetModel()
+
+
+class ThumbnailView(QListView):
+    """
+    Scrollable strip of thumbnails of all loaded files for quick navigation through large batches
+    """
+    indexSelected = pyqtSignal(int)     # emits index of the clicked file
+
+    def __init__(self, files: list[ImageFile]):
+        super(ThumbnailView, self).__init__()
+        self.thumbnail_model = ThumbnailModel(files)
+        self.setModel(self.thumbnail_model)
+
+        # uniform sizes and batched layout keep the view from querying every row of large batches
+        self.setUniformItemSizes(True)
+        self.setLayoutMode(QListView.LayoutMode.Batched)
+        self.setBatchSize(256)
+        self.setViewMode(QListView.ViewMode.IconMode)
+        self.setFlow(QListView.Flow.TopToBottom)
+        self.setWrapping(False)
+        self.setMovement(QListView.Movement.Static)
+        self.setIconSize(QSize(THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        self.setGridSize(QSize(THUMBNAIL_SIZE + 16, THUMBNAIL_SIZE + self.fontMetrics().height() + 12))
+        self.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.setVerticalScrollMode(QAbstractItemView.ScrollMode.ScrollPerPixel)
+        self.setFixedWidth(THUMBNAIL_SIZE + 16 + self.verticalScrollBar().sizeHint().width() + 2 * self.frameWidth())
+        self.setWordWrap(False)
+        self.setTextElideMode(Qt.TextElideMode.ElideMiddle)
+
+        self.clicked.connect(lambda index: self.indexSelected.emit(index.row()))
+
+    @pyqtSlot()
+    def reset_files(self):
+        self.thumbnail_model.reset()
+
+    @pyqtSlot(ImageFile, int)
+    def select_index(self, file: ImageFile, index: int):
+        """
+        highlight the row of the previewed file and scroll it into view
+        :param file: previewed file
+        :param index: its index in the file list
+        :return:
+        """
+        model_index = self.thumbnail_model.index(index)
+        if model_index.isValid():
+            # the file was verified for the preview, it may have turned out to be missing
+            self.thumbnail_model.dataChanged.emit(model_index, model_index, [Qt.ItemDataRole.DisplayRole])
+            self.setCurrentIndex(model_index)
+            self.scrollTo(model_index)
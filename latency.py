@@ -0,0 +1,206 @@
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+# the harness drives the real widgets without a display
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt6.QtWidgets import QApplication
+from PyQt6.QtCore import QObject, QEvent, QFileInfo
+
+from PIL import Image, ImageDraw
+
+from structures import ImageFile
+from MainWindow import MainWindow
+
+
+PERCENTILES = (50, 90, 95, 99)
+# default budgets in ms for the synthetic batch; a run fails if any of them is exceeded
+BUDGETS = {'load.p95': 2000,
+           'navigate.p95': 250,
+           'margins.p95': 150}
+TIMEOUT = 30    # seconds to wait for a preview before an interaction counts as hung
+
+
+class PaintCounter(QObject):
+    """
+    Event filter that counts the paint events of a widget, i.e. the frames in which a new preview was shown
+    """
+    def __init__(self):
+        super(PaintCounter, self).__init__()
+        self.count = 0
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Type.Paint:
+            self.count += 1
+        return False
+
+
+class LatencyHarness:
+    """
+    Runs interactions on a MainWindow and measures the time from each triggering event until the updated
+    preview has been painted
+    """
+    def __init__(self, app: QApplication, window: MainWindow):
+        self.app = app
+        self.window = window
+        self.paint_counter = PaintCounter()
+        self.window.preview.preview_lbl.installEventFilter(self.paint_counter)
+        self.results = dict()   # interaction -> latencies in ms
+
+    def preview_key(self):
+        return self.window.preview.preview_lbl.generation
+
+    def measure(self, name: str, trigger):
+        """
+        run an interaction and wait until the preview shows its result
+        :param name: name of the interaction the latency is recorded for
+        :param trigger: function that starts the interaction
+        :return: latency in ms
+        """
+        self.app.processEvents()    # don't count work left over from the previous interaction
+        key = self.preview_key()
+        start = time.perf_counter()
+        trigger()
+        changed = False
+        paints = self.paint_counter.count
+        while True:
+            if self.preview_key() != key:
+                # the new preview is set, wait for the frame that shows it
+                key = self.preview_key()
+                changed = True
+                paints = self.paint_counter.count
+            elif changed and self.paint_counter.count > paints:
+                break
+            if time.perf_counter() - start > TIMEOUT:
+                raise TimeoutError(f'{name}: no new preview after {TIMEOUT} s')
+            self.app.processEvents()
+        latency = (time.perf_counter() - start) * 1000
+        self.results.setdefault(name, list()).append(latency)
+        return latency
+
+    def run_load(self, paths: list[str], repeats: int):
+        for _ in range(repeats):
+            files = [ImageFile(QFileInfo(p)) for p in paths]   # probing the files is done by the LoadMenu
+            self.measure('load', lambda: self.window.load_menu.loadedFiles.emit(files))
+
+    def run_navigate(self, repeats: int):
+        preview = self.window.preview
+        rng = random.Random(0)
+        for i in range(repeats):
+            if i % 2:
+                self.measure('navigate', lambda: preview.go_to_index(preview.index + 1))
+            else:
+                self.measure('navigate', lambda: preview.go_to_index(rng.randrange(len(self.window.files))))
+
+    def run_margins(self, repeats: int):
+        crop_menu = self.window.crop_menu
+        for i in range(repeats):
+            value = (i % 20 + 1) * max(1, crop_menu.left_edt.maximum() // 50)
+            self.measure('margins', lambda: crop_menu.left_edt.setValue(value))
+
+    def report(self):
+        """
+        latency percentiles of every interaction
+        :return: dict of interaction -> dict of statistic -> ms
+        """
+        report = dict()
+        for name, latencies in self.results.items():
+            ordered = sorted(latencies)
+            stats = {f'p{p}': ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)] for p in PERCENTILES}
+            stats['max'] = ordered[-1]
+            stats['count'] = len(ordered)
+            report[name] = stats
+        return report
+
+
+def create_images(directory: str, count: int, width: int, height: int):
+    """
+    write a synthetic batch of scan-like JPEG pages, every tenth of them in landscape format
+    :param directory: folder for the images
+    :param count: number of images
+    :param width: width of the portrait pages
+    :param height: height of the portrait pages
+    :return: list of paths
+    """
+    pages = list()
+    for size in ((width, height), (height, width)):
+        img = Image.linear_gradient('L').resize(size).convert('RGB')
+        draw = ImageDraw.Draw(img)
+        for y in range(size[1] // 20, size[1], size[1] // 20):   # lines of 'text'
+            draw.rectangle((size[0] // 10, y, size[0] * 9 // 10, y + size[1] // 80), fill=(20, 20, 20))
+        path = os.path.join(directory, f'template_{size[0]}x{size[1]}.jpg')
+        img.save(path, quality=85)
+        pages.append(path)
+
+    paths = list()
+    for i in range(count):
+        path = os.path.join(directory, f'page_{i:05d}.jpg')
+        shutil.copyfile(pages[1 if i % 10 == 9 else 0], path)
+        paths.append(path)
+    return paths
+
+
+def parse_budgets(values: list[str]):
+    budgets = dict(BUDGETS)
+    for value in values:
+        key, _, ms = value.partition('=')
+        budgets[key] = float(ms)
+    return budgets
+
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description='Measure the preview latency of the GUI on a synthetic batch '
+                                                 'and fail if it exceeds the budgets')
+    parser.add_argument('--images', type=int, default=200, help='number of images in the batch')
+    parser.add_argument('--size', default='1240x1754', help='size of the portrait pages as WIDTHxHEIGHT')
+    parser.add_argument('--repeats', type=int, default=50, help='measurements per interaction, 3 for loading')
+    parser.add_argument('--budget', action='append', default=list(), metavar='INTERACTION.STATISTIC=MS',
+                        help='override a budget, e.g. navigate.p95=250; interactions are load, navigate and '
+                             'margins, statistics p50, p90, p95, p99 and max')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args(argv)
+    width, height = (int(v) for v in args.size.lower().split('x'))
+    budgets = parse_budgets(args.budget)
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    with tempfile.TemporaryDirectory() as directory:
+        paths = create_images(directory, args.images, width, height)
+        window = MainWindow()
+        window.resize(1280, 900)
+        window.show()
+        harness = LatencyHarness(app, window)
+
+        harness.run_load(paths, 3)
+        harness.run_navigate(args.repeats)
+        harness.run_margins(args.repeats)
+        report = harness.report()
+        window.close()
+
+    failures = list()
+    print(f'{"interaction":<12}' + ''.join(f'{s:>10}' for s in ('count', 'p50', 'p90', 'p95', 'p99', 'max')))
+    for name, stats in report.items():
+        print(f'{name:<12}{stats["count"]:>10}' + ''.join(f'{stats[s]:>10.1f}'
+                                                        for s in ('p50', 'p90', 'p95', 'p99', 'max')))
+    for key, budget in budgets.items():
+        name, _, statistic = key.partition('.')
+        value = report.get(name, dict()).get(statistic)
+        if value is not None and value > budget:
+            failures.append(f'{key} = {value:.1f} ms exceeds budget of {budget:.1f} ms')
+    for failure in failures:
+        print('FAILED: ' + failure)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'results': report, 'budgets': budgets, 'failures': failures}, f, indent=2)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,13 +1,56 @@
+import time
+START = time.perf_counter()
+
 import sys
-import ctypes
 from PyQt6.QtWidgets import QApplication
-from MainWindow import MainWindow
+from PyQt6.QtCore import QObject, QEvent, QTimer
+
+
+class StartupReport(QObject):
+    """
+    Event filter that prints how long the phases of the application start took once the main window is painted
+    the first time, then ends the application
+    """
+    def __init__(self, app: QApplication):
+        super(StartupReport, self).__init__()
+        self.app = app
+        self.phases = list()
+        self.last = START
+
+    def phase(self, name: str):
+        now = time.perf_counter()
+        self.phases.append((name, (now - self.last) * 1000))
+        self.last = now
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Type.Paint:
+            obj.removeEventFilter(self)
+            self.phase('first paint')
+            for name, ms in self.phases:
+                print(f'{name + ":":<16}{ms:8.1f} ms', file=sys.stderr)
+            print(f'{"total:":<16}{(self.last - START) * 1000:8.1f} ms', file=sys.stderr)
+            QTimer.singleShot(0, self.app.quit)
+        return False
 
 
 if __name__ == '__main__':
-    appID = 'PDFStitcher-v0.2'
-    ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID(appID)
+    report_startup = '--startup-report' in sys.argv
+    if report_startup:
+        sys.argv.remove('--startup-report')
+
+    if sys.platform == 'win32':
+        import ctypes
+        appID = 'PDFStitcher-v0.2'
+        ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID(appID)
     app = QApplication(sys.argv)
+    report = StartupReport(app)
+    report.phase('QApplication')
+
+    from MainWindow import MainWindow
+    report.phase('imports')
     win = MainWindow()
+    report.phase('main window')
+    if report_startup:
+        win.installEventFilter(report)
     win.show()
     sys.exit(app.exec())
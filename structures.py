@@ -1,8 +1,14 @@
-from PyQt6.QtGui import QImage
-from PyQt6.QtCore import QFileInfo
+from PyQt6.QtGui import QImageReader
+from PyQt6.QtCore import QFileInfo, QDateTime
 
-from PIL import Image
 from enum import Enum
+import copy
+import io
+import json
+import os
+
+
+MULTI_FRAME_SUFFIXES = ('tif', 'tiff', 'gif', 'webp')  # formats whose frames are loaded as separate pages
 
 
 class SortKeys(Enum):
@@ -11,6 +17,46 @@ class SortKeys(Enum):
     NAME = 'name'
 
 
+class ColorModes(Enum):
+    COLOR = 'color'
+    GRAYSCALE = 'grayscale'
+    BLACK_WHITE = 'black and white'     # adaptive threshold, best for text
+    DITHERED = 'dithered'               # black and white pixels, keeps an impression of gray tones
+
+
+def _msecs(date_time: QDateTime):
+    return date_time.toMSecsSinceEpoch() if date_time.isValid() else None
+
+
+def _date_time(msecs: int):
+    return QDateTime.fromMSecsSinceEpoch(msecs) if msecs is not None else QDateTime()
+
+
+class _TiffPageFile(io.FileIO):
+    """
+    A multi-page TIFF file as seen from one of its pages: the header points to the directory of that page instead
+    of the first one, so the page is opened without walking through the directories of all the pages before it
+    """
+    def __init__(self, path: str, directory_offset: int):
+        super(_TiffPageFile, self).__init__(path, 'r')
+        header = super(_TiffPageFile, self).read(4)
+        self.seek(0)
+        big_tiff = header[2:4] in (b'\x2b\x00', b'\x00\x2b')
+        self.patch_start = 8 if big_tiff else 4
+        self.patch = directory_offset.to_bytes(8 if big_tiff else 4, 'little' if header[:2] == b'II' else 'big')
+
+    def read(self, size: int = -1):
+        position = self.tell()
+        data = super(_TiffPageFile, self).read(size)
+        patch_end = self.patch_start + len(self.patch)
+        if position < patch_end and position + len(data) > self.patch_start:
+            data = bytearray(data)
+            for i in range(max(self.patch_start, position), min(patch_end, position + len(data))):
+                data[i - position] = self.patch[i - self.patch_start]
+            data = bytes(data)
+        return data
+
+
 class ImageFile:
     def __init__(self, file_info: QFileInfo):
         self.name = file_info.baseName()
@@ -18,21 +64,139 @@ class ImageFile:
         self.create_timestamp = file_info.birthTime()
         self.absolute_path = file_info.absoluteFilePath()
         self.last_modified = file_info.lastModified()
+        self.file_size = file_info.size()
         self.width = 0
         self.height = 0
         self.left_margin, self.right_margin, self.top_margin, self.bottom_margin = 0, 0, 0, 0
+        self.frame = 0          # index of the page in a multi-page or animated image
+        self.frame_count = 1
+        self.frame_offset = 0   # position of the directory of a TIFF page, 0 if the page is found by seeking
+        self._verified = True   # whether the cached metadata is known to match the file on disk
+        self.missing = False    # whether the file couldn't be read when it was last verified
         self.__set_size()
 
+    @classmethod
+    def frames(cls, file_info: QFileInfo):
+        """
+        probe an image file; multi-page TIFFs and animated images give one ImageFile per frame.
+        Only the size and position of every frame are read here, the frames are decoded when they are needed
+        :param file_info: QFileInfo of the image file
+        :return: list of ImageFile
+        """
+        file = cls(file_info)
+        if file.suffix not in MULTI_FRAME_SUFFIXES:
+            return [file]
+        from PIL import Image
+        with Image.open(file.absolute_path, 'r') as img:
+            file.frame_count = getattr(img, 'n_frames', 1)
+            pages = [file]
+            for frame in range(1, file.frame_count):
+                page = file.copy()
+                page.frame = frame
+                if img.format == 'TIFF':    # only TIFF pages can differ in size, other frames share the canvas
+                    img.seek(frame)
+                    page.width, page.height = img.size
+                    page.frame_offset = img.tag_v2.offset
+                pages.append(page)
+        return pages
+
     def __set_size(self):
-        img = Image.open(self.absolute_path, 'r')
-        self.width, self.height = img.size
-        img.close()
+        from PIL import Image   # PIL is only loaded once the first files are, to speed up the start
+        with Image.open(self.absolute_path, 'r') as img:
+            if self.frame:
+                img.seek(self.frame)    # the file has changed, so the position of the frame has to be found again
+                self.frame_offset = img.tag_v2.offset if img.format == 'TIFF' else 0
+            self.width, self.height = img.size
+
+    def display_name(self):
+        return f'{self.name} ({self.frame + 1}/{self.frame_count})' if self.frame_count > 1 else self.name
+
+    def to_dict(self):
+        """
+        the cached metadata and crop margins in a JSON serializable format
+        :return: dict
+        """
+        return {'path': self.absolute_path,
+                'created': _msecs(self.create_timestamp),
+                'modified': _msecs(self.last_modified),
+                'bytes': self.file_size,
+                'size': [self.width, self.height],
+                'frame': [self.frame, self.frame_count, self.frame_offset],
+                'margins': [self.left_margin, self.top_margin, self.right_margin, self.bottom_margin]}
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """
+        restore an ImageFile from cached metadata without accessing the file;
+        whether the file is still the same is only checked once its content is needed
+        :param data: dict created by to_dict
+        :return: ImageFile
+        """
+        file = cls.__new__(cls)
+        file.absolute_path = data['path']
+        file_name = os.path.basename(file.absolute_path)
+        file.name = file_name.split('.')[0]     # same as QFileInfo.baseName
+        file.suffix = file_name.rsplit('.', 1)[-1].lower() if '.' in file_name else ''
+        file.create_timestamp = _date_time(data['created'])
+        file.last_modified = _date_time(data['modified'])
+        file.file_size = data['bytes']
+        file.width, file.height = data['size']
+        file.left_margin, file.top_margin, file.right_margin, file.bottom_margin = data['margins']
+        file.frame, file.frame_count, file.frame_offset = data.get('frame', (0, 1, 0))    # written before frames
+        file._verified = False
+        file.missing = False
+        return file
+
+    def copy(self):
+        """
+        independent copy, e.g. to keep the state of a file for an export while it is still being edited
+        :return: ImageFile
+        """
+        return copy.copy(self)
+
+    def verify(self):
+        """
+        compare the cached metadata with the file on disk and update it if the file has changed.
+        A file that can't be read is marked as missing and checked again the next time, it may be restored
+        :return: whether the cached metadata was still valid
+        """
+        if self._verified:
+            return True
+        try:
+            stat = os.stat(self.absolute_path)
+            modified = stat.st_mtime_ns // 1_000_000
+            if stat.st_size != self.file_size or modified != _msecs(self.last_modified):
+                self.__set_size()
+        except OSError:
+            self.missing = True
+            return False
+        self._verified = True
+        self.missing = False
+        if stat.st_size == self.file_size and modified == _msecs(self.last_modified):
+            return True
+        self.file_size = stat.st_size
+        self.last_modified = QDateTime.fromMSecsSinceEpoch(modified)
+        return False
 
     def q_image(self):
-        return QImage(self.absolute_path)
+        self.verify()
+        reader = QImageReader(self.absolute_path)
+        reader.jumpToImage(self.frame)
+        return reader.read()
 
     def pil_image(self):
-        return Image.open(self.absolute_path, 'r')
+        from PIL import Image
+        self.verify()
+        if self.frame_offset:
+            # the page is loaded right away, PIL wouldn't close a file it didn't open itself
+            with _TiffPageFile(self.absolute_path, self.frame_offset) as f:
+                img = Image.open(f, 'r')
+                img.load()
+            return img
+        img = Image.open(self.absolute_path, 'r')
+        if self.frame:
+            img.seek(self.frame)
+        return img
 
     def set_crop_margins(self, left, top, right, bottom):
         self.left_margin = left
@@ -40,8 +204,127 @@ class ImageFile:
         self.top_margin = top
         self.bottom_margin = bottom
 
+    def crop_box(self):
+        """
+        the crop margins limited to the actual image size
+        :return: left, top, right, bottom
+        """
+        return (min(self.left_margin, self.width), min(self.top_margin, self.height),
+                min(self.right_margin, self.width), min(self.bottom_margin, self.height))
+
+    def is_cropped(self):
+        return self.crop_box() != (0, 0, self.width, self.height)
+
+    def cropped_area_ratio(self):
+        """
+        share of the image area that lies outside the crop margins
+        :return: ratio between 0 and 1
+        """
+        if not self.width or not self.height:
+            return 0
+        left, top, right, bottom = self.crop_box()
+        return 1 - max(0, right - left) * max(0, bottom - top) / (self.width * self.height)
+
     def crop(self):
-        img = Image.open(self.absolute_path, 'r')
-        cropped = img.crop((self.left_margin, self.top_margin, self.right_margin, self.bottom_margin))
+        img = self.pil_image()
+        cropped = img.crop(self.crop_box())
         img.close()
         return cropped
+
+
+class SaveOptions:
+    """
+    Options for the creation of the PDF file as chosen in the SaveDialog
+    """
+    def __init__(self, save_path: str = '', color_mode: ColorModes = ColorModes.COLOR, optimize: bool = False,
+                 compression_level: int = 6, resolution: int = 300, img_scale: float = 1.0,
+                 crop_in_pdf: bool = False, fast_web_view: bool = False, target_size: int = 0,
+                 append: bool = False):
+        self.save_path = save_path
+        self.color_mode = color_mode
+        self.optimize = optimize
+        self.compression_level = compression_level
+        self.resolution = resolution
+        self.img_scale = img_scale
+        self.crop_in_pdf = crop_in_pdf
+        self.fast_web_view = fast_web_view
+        self.target_size = target_size  # maximum size of the PDF in bytes, 0 if there is none
+        self.append = append    # add the pages to an existing file at save_path
+
+    def copy(self):
+        return SaveOptions(**vars(self))
+
+    def to_dict(self):
+        data = dict(vars(self))
+        data['color_mode'] = self.color_mode.value
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        defaults = vars(cls())
+        options = {k: v for k, v in data.items() if k in defaults}
+        if 'color_mode' in options:
+            options['color_mode'] = ColorModes(options['color_mode'])
+        elif data.get('to_grayscale'):  # written before there were more color modes
+            options['color_mode'] = ColorModes.GRAYSCALE
+        return cls(**options)
+
+
+class Session:
+    """
+    Snapshot of the editing state that can be written to a session file and restored from it
+    without having to probe every image again
+    """
+    VERSION = 1
+
+    def __init__(self, files: list[ImageFile], sort_key: SortKeys = SortKeys.CREATE_DATE,
+                 double_pages: bool = False, right_to_left: bool = False, separate_cover: bool = False,
+                 same_crop_for_all: bool = True, save_profiles: list[SaveOptions] = None,
+                 long_strip: bool = False, cut_at_gaps: bool = True):
+        self.files = files
+        self.sort_key = sort_key
+        self.double_pages = bool(double_pages)
+        self.right_to_left = bool(right_to_left)
+        self.separate_cover = bool(separate_cover)     # checkbox states arrive as int from Qt
+        self.same_crop_for_all = bool(same_crop_for_all)
+        self.save_profiles = save_profiles if save_profiles else [SaveOptions()]
+        self.long_strip = bool(long_strip)
+        self.cut_at_gaps = bool(cut_at_gaps)
+
+    def save(self, path: str):
+        data = {'version': self.VERSION,
+                'sort_key': self.sort_key.value,
+                'layout': {'double_pages': self.double_pages,
+                           'right_to_left': self.right_to_left,
+                           'separate_cover': self.separate_cover,
+                           'long_strip': self.long_strip,
+                           'cut_at_gaps': self.cut_at_gaps},
+                'same_crop_for_all': self.same_crop_for_all,
+                'save_profiles': [p.to_dict() for p in self.save_profiles],
+                'files': [f.to_dict() for f in self.files]}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+
+    @classmethod
+    def load(cls, path: str):
+        """
+        read a session file
+        :param path: path of the session file
+        :return: Session
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        version = data.get('version') if isinstance(data, dict) else None
+        if version != cls.VERSION:
+            raise ValueError(f'unsupported session file version: {version}')
+        layout = data['layout']
+        profiles = data['save_profiles'] if 'save_profiles' in data else [data['save_options']]  # single profile
+        return cls([ImageFile.from_dict(f) for f in data['files']],
+                   SortKeys(data['sort_key']),
+                   layout['double_pages'],
+                   layout['right_to_left'],
+                   layout['separate_cover'],
+                   data['same_crop_for_all'],
+                   [SaveOptions.from_dict(p) for p in profiles],
+                   layout.get('long_strip', False),    # written before there were long strips
+                   layout.get('cut_at_gaps', True))